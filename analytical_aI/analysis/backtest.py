@@ -1,8 +1,9 @@
 import sys
 import os
+import argparse
+from functools import partial
 import numpy as np
 import pandas as pd
-from joblib import load
 import optuna  # 追加: 最適化ライブラリ
 
 # --- プロジェクトルートをPythonの検索パスに追加 ---
@@ -11,13 +12,24 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 # --- モジュールをインポート ---
-from analytical_aI.config.index import DATA_PATH, MODELS_DIR, TRAIN_RATIO
+from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO
 from analytical_aI.data.loader import load_and_split_data
 from analytical_aI.data.preprocessor import FEATURE_COLS
+from analytical_aI.data.fingerprint import fingerprint_frame, fingerprint_params
+from analytical_aI.models.ensemble import load_model, race_softmax
+from analytical_aI.analysis.study_store import make_study_name, run_study
 
 # ログを少し静かにする（Optunaの出力が多すぎるのを防ぐ）
 optuna.logging.set_verbosity(optuna.logging.WARNING)
 
+def add_predictions(df: pd.DataFrame, model, available_features: list[str]) -> pd.DataFrame:
+    """予測スコア・レース内softmax勝率・期待値(EV)の列を付与して返す。"""
+    df = df.copy()
+    df['predicted_score'] = model.predict(df[available_features])
+    df['predicted_win_rate'] = race_softmax(df['predicted_score'].to_numpy(), df['race_id'].to_numpy())
+    df['expected_value'] = df['predicted_win_rate'] * df['odds']
+    return df
+
 def calculate_roi(df_untouched: pd.DataFrame, bet_threshold: float, win_rate_threshold: float, race_budget: int = 100):
     """
     【高速化版】ループ(iterrows)を排除し、ベクトル演算のみでシミュレーションを行う
@@ -49,14 +61,55 @@ def calculate_roi(df_untouched: pd.DataFrame, bet_threshold: float, win_rate_thr
 
     return roi, bet_races, num_bets, total_investment, total_return
 
-def main():
+# 探索範囲（study 名の指紋に含めるため定数化）
+SEARCH_SPACE = {
+    "bet_threshold": (1.1, 2.0),
+    "win_rate_threshold": (0.07, 0.20),
+    "min_bet_ratio": 0.25,
+}
+
+
+def roi_objective(trial, df_optuna: pd.DataFrame, total_races: int) -> float:
+    """Optuna の目的関数。ワーカープロセスへ渡せるようにモジュール直下に定義している。"""
+    # 探索するパラメータの範囲を定義
+    bet_threshold = trial.suggest_float("bet_threshold", *SEARCH_SPACE["bet_threshold"])
+    win_rate_threshold = trial.suggest_float("win_rate_threshold", *SEARCH_SPACE["win_rate_threshold"])
+
+    roi, bet_races, _, _, _ = calculate_roi(df_optuna, bet_threshold, win_rate_threshold)
+
+    if bet_races < (total_races * SEARCH_SPACE["min_bet_ratio"]):
+        return 0.0
+
+    return roi
+
+def split_optuna_test(df_untouched: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """race_id 昇順でソートし、前半50%をOptuna用、後半50%をテスト用に分割する。"""
+    all_races = sorted(df_untouched['race_id'].unique())
+    split = len(all_races) // 2
+    df_optuna = df_untouched[df_untouched['race_id'].isin(all_races[:split])]
+    df_test   = df_untouched[df_untouched['race_id'].isin(all_races[split:])]
+    return df_optuna, df_test
+
+
+def backtest_study_name(df_optuna: pd.DataFrame, total_races: int) -> str:
+    """
+    目的関数の入力（予測勝率・オッズ・着順）と探索範囲から study 名を作る。
+    同じなら同じ study 名になり、中断後の再開や完了済み結果の再利用ができる
+    （モデル・特徴量が変われば予測勝率が変わる）。
+    """
+    return make_study_name(
+        "backtest",
+        fingerprint_frame(df_optuna, ['race_id', 'odds', 'label', 'predicted_win_rate']),
+        fingerprint_params({**SEARCH_SPACE, "total_races": total_races}),
+    )
+
+def main(use_ensemble: bool = False, n_trials: int = 200, n_workers: int = 1, storage: str | None = None):
     print("--- ベッティングロジックの自動最適化を開始します ---")
 
     # --- 1. モデルとデータの読み込み（1回だけ実行） ---
-    model_path = MODELS_DIR / 'lambdarank_model.joblib'
     print("1. モデルとデータを読み込み中...")
     try:
-        model = load(model_path)
+        model = load_model(use_ensemble)
     except FileNotFoundError:
         print(f"エラー: モデルファイルが見つかりません。")
         return
@@ -66,51 +119,31 @@ def main():
         return
 
     available_features = [f for f in FEATURE_COLS if f in df_untouched.columns]
-    X_untouched = df_untouched[available_features]
 
     # --- 2. スコア予測と期待値計算（これも1回だけ実行でOK） ---
     print("2. スコア予測と期待値(EV)を計算中...")
-    df_untouched['predicted_score'] = model.predict(X_untouched)
-
-    def softmax(x):
-        e_x = np.exp(x - np.max(x))
-        return e_x / e_x.sum()
-
-    df_untouched['predicted_win_rate'] = df_untouched.groupby('race_id')['predicted_score'].transform(
-        lambda x: softmax(x.values)
-    )
-    df_untouched['expected_value'] = df_untouched['predicted_win_rate'] * df_untouched['odds']
+    df_untouched = add_predictions(df_untouched, model, available_features)
 
     total_races = df_untouched['race_id'].nunique()
 
     # race_id 昇順でソートし、前半50%をOptuna用、後半50%をテスト用に分割
-    all_races = sorted(df_untouched['race_id'].unique())
-    split = len(all_races) // 2
-    df_optuna = df_untouched[df_untouched['race_id'].isin(all_races[:split])]
-    df_test   = df_untouched[df_untouched['race_id'].isin(all_races[split:])]
-    optuna_races = len(all_races[:split])
+    df_optuna, df_test = split_optuna_test(df_untouched)
 
 
     # --- 3. Optunaによる最適化 ---
     print("3. Optunaで最適な閾値(bet_threshold, win_rate_threshold)を探索中...")
 
-    def objective(trial):
-        # 探索するパラメータの範囲を定義
-        bet_threshold = trial.suggest_float("bet_threshold", 1.1, 2.0)
-        win_rate_threshold = trial.suggest_float("win_rate_threshold", 0.07, 0.20)
-
-        roi, bet_races, _, _, _ = calculate_roi(df_optuna, bet_threshold, win_rate_threshold)
-
-        if bet_races < (total_races * 0.25):
-            return 0.0
-            
-        return roi
+    study_name = backtest_study_name(df_optuna, total_races)
 
     # ROIを「最大化(maximize)」する方向で探索
-    study = optuna.create_study(direction="maximize")
-    
     # 200回シミュレーションを回す（数秒〜数十秒で終わります）
-    study.optimize(objective, n_trials=200)
+    study = run_study(
+        study_name,
+        partial(roi_objective, df_optuna=df_optuna, total_races=total_races),
+        n_trials=n_trials,
+        storage=storage,
+        n_workers=n_workers,
+    )
 
     best_params = study.best_params
     best_roi = study.best_value
@@ -132,4 +165,10 @@ def main():
     print("-------------------------")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ensemble", action="store_true", help="シードアンサンブル（train.py --ensemble-size）で予測する")
+    parser.add_argument("--n-trials", type=int, default=200, help="Optuna の試行回数（デフォルト: 200）")
+    parser.add_argument("--workers", type=int, default=1, help="同じ study を共有して探索するプロセス数")
+    parser.add_argument("--storage", type=str, default=None, help="study の保存先（ジャーナルファイルのパス or sqlite:/// 形式のURL）")
+    args = parser.parse_args()
+    main(args.ensemble, args.n_trials, args.workers, args.storage)
\ No newline at end of file
@@ -0,0 +1,330 @@
+import sys
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# --- プロジェクトルートをPythonの検索パスに追加 ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO
+from analytical_aI.data.loader import load_and_split_data
+from analytical_aI.data.preprocessor import FEATURE_COLS
+from analytical_aI.analysis.backtest import add_predictions
+from analytical_aI.models.ensemble import load_model
+
+
+def calculate_race_returns(df: pd.DataFrame, bet_threshold: float, win_rate_threshold: float) -> pd.DataFrame:
+    """
+    calculate_roi と同じ買い目選択・予算配分で、賭けたレースごとの収支倍率を race_id 昇順で返す。
+
+    Returns:
+        pd.DataFrame: race_id をインデックスとし、以下の列を持つ
+            payout_multiple : 投資1円あたりの払戻額（全外れなら 0）
+            win_prob        : 買い目のいずれかが1着になる予測確率
+            expected_multiple: 投資1円あたりの期待払戻額
+            kelly_fraction  : 買い目全体を1つの賭けとみなしたケリー基準の賭け割合（0〜1）
+    """
+    mask = (df['expected_value'] > bet_threshold) & (df['predicted_win_rate'] > win_rate_threshold)
+    value_bets = df.loc[mask, ['race_id', 'predicted_win_rate', 'odds', 'label']].copy()
+
+    if value_bets.empty:
+        return pd.DataFrame(columns=['payout_multiple', 'win_prob', 'expected_multiple', 'kelly_fraction'])
+
+    # calculate_roi と同様に、予測勝率に比例してレース予算を配分する
+    prob_sums = value_bets.groupby('race_id')['predicted_win_rate'].transform('sum')
+    weight = value_bets['predicted_win_rate'] / prob_sums
+
+    value_bets['payout'] = np.where(value_bets['label'] == 3, weight * value_bets['odds'], 0.0)
+    value_bets['expected'] = weight * value_bets['predicted_win_rate'] * value_bets['odds']
+
+    races = value_bets.groupby('race_id').agg(
+        payout_multiple=('payout', 'sum'),
+        win_prob=('predicted_win_rate', 'sum'),
+        expected_multiple=('expected', 'sum'),
+    ).sort_index()
+
+    # 的中時の純オッズ b = 期待払戻 / 的中確率 - 1 として f* = (期待払戻 - 1) / b
+    net_odds = races['expected_multiple'] / races['win_prob'] - 1
+    kelly = np.where(net_odds > 0, (races['expected_multiple'] - 1) / net_odds, 0.0)
+    races['kelly_fraction'] = np.clip(kelly, 0.0, 1.0)
+
+    return races
+
+
+def build_strategy_grid(
+    flat_amounts=None,
+    fractions=None,
+    kelly_multipliers=None,
+    max_fractions=None,
+) -> pd.DataFrame:
+    """
+    評価する賭け金ルールの一覧を作る。1行が1ルールで、シミュレーションでは配列の1次元として扱う。
+
+    kind:
+        flat         : 毎レース flat_amount 円を賭ける
+        proportional : 毎レース資金の fraction 倍を賭ける
+        kelly        : 資金 × kelly_multiplier × ケリー割合 を賭ける（フラクショナル・ケリー）
+        capped       : kelly と同じだが、1レースの賭け金を資金の max_fraction 倍までに制限する
+    """
+    if flat_amounts is None:
+        flat_amounts = [100, 200, 500, 1000, 2000, 5000]
+    if fractions is None:
+        fractions = np.round(np.linspace(0.005, 0.2, 40), 4)
+    if kelly_multipliers is None:
+        kelly_multipliers = np.round(np.linspace(0.05, 1.0, 20), 3)
+    if max_fractions is None:
+        max_fractions = [0.01, 0.02, 0.05, 0.1]
+
+    rows = []
+    for amount in flat_amounts:
+        rows.append(('flat', amount, 0.0, 0.0, 1.0))
+    for fraction in fractions:
+        rows.append(('proportional', 0.0, fraction, 0.0, 1.0))
+    for multiplier in kelly_multipliers:
+        rows.append(('kelly', 0.0, 0.0, multiplier, 1.0))
+    for multiplier in kelly_multipliers:
+        for cap in max_fractions:
+            rows.append(('capped', 0.0, 0.0, multiplier, cap))
+
+    grid = pd.DataFrame(rows, columns=['kind', 'flat_amount', 'fraction', 'kelly_multiplier', 'max_fraction'])
+    grid['name'] = grid.apply(
+        lambda r: {
+            'flat': f"flat({r.flat_amount:g})",
+            'proportional': f"prop({r.fraction:g})",
+            'kelly': f"kelly({r.kelly_multiplier:g})",
+            'capped': f"kelly({r.kelly_multiplier:g},cap={r.max_fraction:g})",
+        }[r.kind],
+        axis=1,
+    )
+    return grid[['name', 'kind', 'flat_amount', 'fraction', 'kelly_multiplier', 'max_fraction']]
+
+
+def _bankroll_paths(net: np.ndarray, kelly: np.ndarray, strategies: pd.DataFrame, initial_bankroll: float) -> np.ndarray:
+    """
+    レースごとの純収支倍率 net (P, T) とケリー割合 kelly (P, T) から、
+    全ルールの資金推移 (P, S, T) を累積演算だけで求める。
+
+    - 資金比例型（proportional / kelly / capped）: 資金 × (1 + g × net) の累積積を log の累積和で計算
+    - 定額型（flat）: 累積和で計算し、資金が賭け金を下回ったレース以降は賭けを止めて資金を固定
+    """
+    is_flat = (strategies['kind'] == 'flat').to_numpy()[None, :, None]
+    flat_amount = strategies['flat_amount'].to_numpy(dtype=float)[None, :, None]
+    fraction = strategies['fraction'].to_numpy(dtype=float)[None, :, None]
+    kelly_multiplier = strategies['kelly_multiplier'].to_numpy(dtype=float)[None, :, None]
+    max_fraction = strategies['max_fraction'].to_numpy(dtype=float)[None, :, None]
+
+    net = net[:, None, :]
+    kelly = kelly[:, None, :]
+
+    # --- 資金比例型 ---
+    stake_fraction = np.minimum(fraction + kelly_multiplier * kelly, max_fraction)
+    with np.errstate(divide='ignore'):
+        log_growth = np.log(np.maximum(1.0 + stake_fraction * net, 0.0))
+    proportional_path = initial_bankroll * np.exp(np.cumsum(log_growth, axis=-1))
+
+    # --- 定額型 ---
+    flat_path = initial_bankroll + flat_amount * np.cumsum(net, axis=-1)
+    before_race = np.concatenate(
+        [np.full(flat_path.shape[:-1] + (1,), float(initial_bankroll)), flat_path[..., :-1]], axis=-1
+    )
+    can_bet = np.logical_and.accumulate(before_race >= flat_amount, axis=-1)
+    last_bet = can_bet.sum(axis=-1, keepdims=True) - 1
+    frozen = np.where(
+        last_bet >= 0,
+        np.take_along_axis(flat_path, np.maximum(last_bet, 0), axis=-1),
+        float(initial_bankroll),
+    )
+    flat_path = np.where(can_bet, flat_path, frozen)
+
+    return np.where(is_flat, flat_path, proportional_path)
+
+
+def _drawdown(paths: np.ndarray, initial_bankroll: float) -> np.ndarray:
+    """資金推移から各時点のドローダウン率（直近ピークからの下落率）を返す。"""
+    peak = np.maximum(np.maximum.accumulate(paths, axis=-1), initial_bankroll)
+    return 1.0 - paths / peak
+
+
+def simulate_bankroll(
+    race_returns: pd.DataFrame,
+    strategies: pd.DataFrame,
+    initial_bankroll: float = 100_000,
+    ruin_fraction: float = 0.1,
+) -> dict:
+    """
+    レースを race_id 昇順（時系列）に辿り、全ルールの資金推移を一括で求める。
+
+    Args:
+        race_returns: calculate_race_returns の戻り値
+        strategies: build_strategy_grid の戻り値
+        ruin_fraction: 資金が初期資金のこの割合以下になったら「破産」とみなす
+
+    Returns:
+        dict:
+            summary  : ルールごとの最終資金・最大ドローダウン・破産有無の DataFrame
+            bankroll : 資金推移 (S, T)
+            drawdown : ドローダウン推移 (S, T)
+            race_ids : 時系列順の race_id (T,)
+    """
+    race_returns = race_returns.sort_index()
+    summary = strategies.copy()
+    if race_returns.empty:
+        # 賭けたレースがなければ、全ルールとも資金は初期資金のまま（_bankroll_paths は1レース以上が前提）
+        summary['final_bankroll'] = float(initial_bankroll)
+        summary['max_drawdown'] = 0.0
+        summary['min_bankroll'] = float(initial_bankroll)
+        summary['total_return'] = 0.0
+        summary['ruined'] = False
+        summary['ruin_race_id'] = None
+        return {
+            'summary': summary.reset_index(drop=True),
+            'bankroll': np.empty((len(strategies), 0)),
+            'drawdown': np.empty((len(strategies), 0)),
+            'race_ids': race_returns.index.to_numpy(),
+        }
+
+    net = race_returns['payout_multiple'].to_numpy(dtype=float)[None, :] - 1.0
+    kelly = race_returns['kelly_fraction'].to_numpy(dtype=float)[None, :]
+
+    bankroll = _bankroll_paths(net, kelly, strategies, initial_bankroll)[0]
+    drawdown = _drawdown(bankroll, initial_bankroll)
+
+    ruin_mask = bankroll <= initial_bankroll * ruin_fraction
+    ruined = ruin_mask.any(axis=1)
+    ruin_idx = ruin_mask.argmax(axis=1)
+    race_ids = race_returns.index.to_numpy()
+
+    summary['final_bankroll'] = bankroll[:, -1]
+    summary['max_drawdown'] = drawdown.max(axis=1)
+    summary['min_bankroll'] = bankroll.min(axis=1)
+    summary['total_return'] = (summary['final_bankroll'] / initial_bankroll - 1) * 100
+    summary['ruined'] = ruined
+    summary['ruin_race_id'] = np.where(ruined, race_ids[ruin_idx], None)
+
+    return {
+        'summary': summary.reset_index(drop=True),
+        'bankroll': bankroll,
+        'drawdown': drawdown,
+        'race_ids': race_ids,
+    }
+
+
+def estimate_ruin_probability(
+    race_returns: pd.DataFrame,
+    strategies: pd.DataFrame,
+    initial_bankroll: float = 100_000,
+    ruin_fraction: float = 0.1,
+    n_paths: int = 500,
+    seed: int = 42,
+    max_bytes: int = 512 * 1024 ** 2,
+) -> pd.DataFrame:
+    """
+    賭けたレースを復元抽出（ブートストラップ）した n_paths 本の資金推移から、ルールごとの
+    破産確率と最大ドローダウン・最終資金の分位点を推定する。
+
+    並べ替えでは資金比例型の最終資金が変わらないため、復元抽出で標本のばらつきを反映する。
+    パス (P) × ルール (S) × レース (T) の配列は、一時配列の合計が max_bytes 程度に
+    収まる本数ずつまとめて計算する。
+    """
+    result = strategies.copy()
+    if race_returns.empty:
+        # 賭けたレースがなければ、全ルールとも資金は初期資金のまま（_bankroll_paths は1レース以上が前提）
+        result['ruin_probability'] = 0.0
+        result['median_final_bankroll'] = float(initial_bankroll)
+        result['p05_final_bankroll'] = float(initial_bankroll)
+        result['median_max_drawdown'] = 0.0
+        result['p95_max_drawdown'] = 0.0
+        return result.reset_index(drop=True)
+
+    net = race_returns['payout_multiple'].to_numpy(dtype=float) - 1.0
+    kelly = race_returns['kelly_fraction'].to_numpy(dtype=float)
+    rng = np.random.default_rng(seed)
+
+    # _bankroll_paths / _drawdown は (S, T) の float64 一時配列を1パスあたり8個ほど作る
+    bytes_per_path = 8 * 8 * len(strategies) * len(net)
+    chunk_size = int(np.clip(max_bytes // bytes_per_path, 1, n_paths))
+
+    ruin_counts = np.zeros(len(strategies))
+    max_drawdowns, finals = [], []
+
+    for start in range(0, n_paths, chunk_size):
+        n = min(chunk_size, n_paths - start)
+        sample = rng.integers(0, len(net), size=(n, len(net)))
+        paths = _bankroll_paths(net[sample], kelly[sample], strategies, initial_bankroll)
+
+        ruin_counts += (paths <= initial_bankroll * ruin_fraction).any(axis=-1).sum(axis=0)
+        max_drawdowns.append(_drawdown(paths, initial_bankroll).max(axis=-1))
+        finals.append(paths[..., -1])
+
+    max_drawdowns = np.concatenate(max_drawdowns, axis=0)
+    finals = np.concatenate(finals, axis=0)
+
+    result['ruin_probability'] = ruin_counts / n_paths
+    result['median_final_bankroll'] = np.median(finals, axis=0)
+    result['p05_final_bankroll'] = np.quantile(finals, 0.05, axis=0)
+    result['median_max_drawdown'] = np.median(max_drawdowns, axis=0)
+    result['p95_max_drawdown'] = np.quantile(max_drawdowns, 0.95, axis=0)
+    return result.reset_index(drop=True)
+
+
+def main(bet_threshold: float, win_rate_threshold: float, initial_bankroll: float, n_paths: int, use_ensemble: bool = False):
+    print("--- 資金推移シミュレーションを開始します ---")
+
+    print("1. モデルとデータを読み込み中...")
+    try:
+        model = load_model(use_ensemble)
+    except FileNotFoundError:
+        print(f"エラー: モデルファイルが見つかりません。")
+        return
+
+    _, df_untouched = load_and_split_data(DATA_PATH, TRAIN_RATIO)
+    if df_untouched.empty:
+        return
+
+    available_features = [f for f in FEATURE_COLS if f in df_untouched.columns]
+
+    print("2. スコア予測と期待値(EV)を計算中...")
+    df_untouched = add_predictions(df_untouched, model, available_features)
+
+    race_returns = calculate_race_returns(df_untouched, bet_threshold, win_rate_threshold)
+    if race_returns.empty:
+        print("賭け対象のレースがありません。")
+        return
+
+    strategies = build_strategy_grid()
+    print(f"3. {len(strategies)} 個の賭け金ルール × {len(race_returns)} レースを時系列で評価中...")
+    result = simulate_bankroll(race_returns, strategies, initial_bankroll)
+
+    summary = result['summary']
+    if n_paths > 0:
+        print(f"4. 賭けたレースを {n_paths} 回復元抽出して破産確率を推定中...")
+        risk = estimate_ruin_probability(race_returns, strategies, initial_bankroll, n_paths=n_paths)
+        summary = summary.merge(
+            risk[['name', 'ruin_probability', 'p05_final_bankroll', 'p95_max_drawdown']], on='name'
+        )
+
+    display_cols = [c for c in [
+        'name', 'final_bankroll', 'total_return', 'max_drawdown', 'ruined',
+        'ruin_probability', 'p05_final_bankroll', 'p95_max_drawdown',
+    ] if c in summary.columns]
+
+    print(f"\n--- 最終資金の上位10ルール（初期資金 {initial_bankroll:,.0f} 円）---")
+    print(summary.sort_values('final_bankroll', ascending=False)[display_cols].head(10).to_string(index=False))
+
+    print("\n--- 種類ごとの最良ルール ---")
+    best_by_kind = summary.loc[summary.groupby('kind')['final_bankroll'].idxmax()]
+    print(best_by_kind[display_cols].to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bet-threshold", type=float, default=1.3, help="期待値の閾値（デフォルト: 1.3）")
+    parser.add_argument("--win-rate-threshold", type=float, default=0.1, help="予測勝率の閾値（デフォルト: 0.1）")
+    parser.add_argument("--initial-bankroll", type=float, default=100_000, help="初期資金（デフォルト: 100000）")
+    parser.add_argument("--n-paths", type=int, default=500, help="破産確率推定のブートストラップ回数（0 で無効）")
+    parser.add_argument("--ensemble", action="store_true", help="シードアンサンブル（train.py --ensemble-size）で予測する")
+    args = parser.parse_args()
+    main(args.bet_threshold, args.win_rate_threshold, args.initial_bankroll, args.n_paths, args.ensemble)
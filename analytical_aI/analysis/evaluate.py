@@ -3,8 +3,6 @@ import os
 import argparse
 import numpy as np
 import pandas as pd
-import lightgbm as lgb
-from lightgbm.callback import early_stopping, log_evaluation
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import optuna
 
@@ -14,10 +12,20 @@ if project_root not in sys.path:
 
 from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO
 from analytical_aI.data.loader import load_and_split_data
-from analytical_aI.data.preprocessor import FEATURE_COLS, CAT_COLS
+from analytical_aI.data.preprocessor import FEATURE_COLS
+from analytical_aI.data.fingerprint import fingerprint_frame, fingerprint_params
+from analytical_aI.models.ensemble import SeedEnsemble, fit_seed_model, save_ensemble
+from analytical_aI.analysis.study_store import make_study_name, run_study
 
 optuna.logging.set_verbosity(optuna.logging.WARNING)
 
+# 閾値の探索範囲（study 名の指紋に含めるため定数化）
+SEARCH_SPACE = {
+    "bet_threshold": (1.1, 2.0),
+    "win_rate_threshold": (0.07, 0.20),
+    "min_bet_ratio": 0.25,
+}
+
 
 def softmax(x):
     e_x = np.exp(x - np.max(x))
@@ -43,7 +51,7 @@ def calculate_roi(df, bet_threshold, win_rate_threshold, race_budget=100):
     return roi, bet_races
 
 
-def run_trial(trial_idx, train_df, unseen_df, available_features, seed):
+def run_trial(trial_idx, train_df, unseen_df, available_features, seed, storage=None):
     # --- 学習/検証分割 ---
     unique_races = sorted(train_df['race_id'].unique())
     split_idx = int(len(unique_races) * 0.8)
@@ -61,17 +69,7 @@ def run_trial(trial_idx, train_df, unseen_df, available_features, seed):
     group_val = v_df.groupby('race_id', sort=False).size().tolist()
 
     # --- LambdaRank ---
-    model = lgb.LGBMRanker(
-        objective="lambdarank", metric="ndcg", boosting_type="gbdt",
-        n_estimators=1000, learning_rate=0.05, num_leaves=63,
-        importance_type="gain", random_state=seed, n_jobs=1,
-    )
-    model.fit(
-        X_train, y_train, group=group_train,
-        eval_set=[(X_val, y_val)], eval_group=[group_val], eval_at=[3, 5],
-        categorical_feature=CAT_COLS,
-        callbacks=[early_stopping(stopping_rounds=50), log_evaluation(period=-1)],
-    )
+    model = fit_seed_model(X_train, y_train, group_train, X_val, y_val, group_val, seed)
 
     # --- 未知データで予測 ---
     df = unseen_df.copy()
@@ -88,18 +86,21 @@ def run_trial(trial_idx, train_df, unseen_df, available_features, seed):
     df_test    = df[df['race_id'].isin(all_races[split:])]
     total_races = df['race_id'].nunique()
 
-    sampler = optuna.samplers.TPESampler(seed=seed)
-    study   = optuna.create_study(direction="maximize", sampler=sampler)
-
     def objective(trial):
-        bet_threshold      = trial.suggest_float("bet_threshold", 1.1, 2.0)
-        win_rate_threshold = trial.suggest_float("win_rate_threshold", 0.07, 0.20)
+        bet_threshold      = trial.suggest_float("bet_threshold", *SEARCH_SPACE["bet_threshold"])
+        win_rate_threshold = trial.suggest_float("win_rate_threshold", *SEARCH_SPACE["win_rate_threshold"])
         roi, bet_races = calculate_roi(df_optuna, bet_threshold, win_rate_threshold)
-        if bet_races < total_races * 0.25:
+        if bet_races < total_races * SEARCH_SPACE["min_bet_ratio"]:
             return 0.0
         return roi
 
-    study.optimize(objective, n_trials=500)
+    # 目的関数の入力（予測勝率・オッズ・着順）と探索範囲が同じなら同じ study を再開・再利用できる
+    study_name = make_study_name(
+        f"evaluate-seed{seed}",
+        fingerprint_frame(df_optuna, ['race_id', 'odds', 'label', 'predicted_win_rate']),
+        fingerprint_params({**SEARCH_SPACE, "total_races": total_races}),
+    )
+    study = run_study(study_name, objective, n_trials=500, storage=storage, seed=seed)
 
     roi, bet_races = calculate_roi(
         df_test,
@@ -115,10 +116,11 @@ def run_trial(trial_idx, train_df, unseen_df, available_features, seed):
         'roi':   roi,
         'participation': participation,
         'best_params': study.best_params,
+        'model': model,
     }
 
 
-def main(n_trials=20, base_seed=42):
+def main(n_trials=20, base_seed=42, save=False, storage=None):
     print("データを読み込み中（1回のみ）...")
     train_df, unseen_df = load_and_split_data(DATA_PATH, TRAIN_RATIO)
 
@@ -131,7 +133,7 @@ def main(n_trials=20, base_seed=42):
 
     with ThreadPoolExecutor(max_workers=n_trials) as executor:
         futures = {
-            executor.submit(run_trial, i, train_df, unseen_df, available_features, seeds[i]): i
+            executor.submit(run_trial, i, train_df, unseen_df, available_features, seeds[i], storage): i
             for i in range(n_trials)
         }
         for future in as_completed(futures):
@@ -145,10 +147,16 @@ def main(n_trials=20, base_seed=42):
     print(f"最小/最大: {np.min(rois):.2f}% / {np.max(rois):.2f}%")
     print(f"{'='*55}")
 
+    if save:
+        # 評価に使ったシードモデルを捨てずに1つのアンサンブルとして保存
+        save_ensemble(SeedEnsemble([r['model'] for r in results], seeds, available_features))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--n-trials", type=int, default=20, help="試行回数（デフォルト: 10）")
     parser.add_argument("--base-seed", type=int, default=42, help="ベースシード（デフォルト: 42）")
+    parser.add_argument("--save-ensemble", action="store_true", help="学習したシードモデル群をアンサンブルとして保存する")
+    parser.add_argument("--storage", type=str, default=None, help="study の保存先（ジャーナルファイルのパス or sqlite:/// 形式のURL）")
     args = parser.parse_args()
-    main(args.n_trials, args.base_seed)
+    main(args.n_trials, args.base_seed, args.save_ensemble, args.storage)
@@ -0,0 +1,214 @@
+import sys
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# --- プロジェクトルートをPythonの検索パスに追加 ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO
+from analytical_aI.data.loader import load_and_split_data
+from analytical_aI.data.preprocessor import FEATURE_COLS
+from analytical_aI.analysis.backtest import add_predictions, split_optuna_test, backtest_study_name
+from analytical_aI.analysis.study_store import load_best_params
+from analytical_aI.models.ensemble import load_model
+
+
+def build_scenarios(
+    noise_sigmas=(0.05, 0.1, 0.2, 0.3),
+    n_noise_draws: int = 20,
+    drifts=(-0.3, -0.2, -0.1, 0.1, 0.2, 0.3),
+    fl_alphas=(0.8, 0.9, 1.1, 1.2),
+) -> pd.DataFrame:
+    """
+    購入時オッズ（確定前オッズ）の想定モデルを列挙する。1行が1シナリオ。
+
+    kind:
+        identity           : 確定オッズで購入できたとみなす（従来のバックテストと同じ）
+        noise              : 馬ごとに対数正規の乗法ノイズ（param = σ、draw ごとに別乱数）
+        takeout_drift      : 控除率（レースの払戻率）を保ったまま、暗黙確率を均等方向へ param だけ寄せる
+                             （param > 0 なら購入時は確定時より人気馬のオッズが高い = 締切直前に人気馬へ票が入る）
+        favourite_longshot : 暗黙確率を param 乗して正規化（param > 1 で人気馬有利・穴馬不利の歪みを強める）
+    """
+    rows = [('identity', 0.0, 0)]
+    rows += [('noise', sigma, draw) for sigma in noise_sigmas for draw in range(n_noise_draws)]
+    rows += [('takeout_drift', d, 0) for d in drifts]
+    rows += [('favourite_longshot', alpha, 0) for alpha in fl_alphas]
+    return pd.DataFrame(rows, columns=['kind', 'param', 'draw'])
+
+
+class _RaceGroups:
+    """race_id ごとの合計を (行数, シナリオ数) の配列のまま計算するためのインデックス。"""
+
+    def __init__(self, race_ids):
+        self.codes, _ = pd.factorize(np.asarray(race_ids))
+        self.order = np.argsort(self.codes, kind='stable')
+        sorted_codes = self.codes[self.order]
+        self.starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """レースごとの合計 (レース数, ...) を返す。"""
+        return np.add.reduceat(values[self.order], self.starts, axis=0)
+
+    def broadcast_sum(self, values: np.ndarray) -> np.ndarray:
+        """レースごとの合計を各行に展開して返す（groupby().transform('sum') 相当）。"""
+        return self.sum(values)[self.codes]
+
+
+def perturb_odds(df: pd.DataFrame, scenarios: pd.DataFrame, seed: int = 42) -> np.ndarray:
+    """
+    確定オッズから全シナリオの購入時オッズを一括で作り、(行数, シナリオ数) の配列で返す。
+
+    takeout_drift / favourite_longshot はレースごとの払戻率 Σ(1/odds) を保つため、
+    暗黙確率を変形して正規化したあと同じ払戻率でオッズに戻す。
+    """
+    groups = _RaceGroups(df['race_id'])
+    odds = df['odds'].to_numpy(dtype=float)
+    kind = scenarios['kind'].to_numpy()
+    param = scenarios['param'].to_numpy(dtype=float)
+
+    implied = 1.0 / odds
+    book = groups.broadcast_sum(implied)             # レースの Σ(1/odds)（控除分だけ 1 を超える）
+    prob = implied / book                            # 正規化した暗黙確率
+    field_size = groups.broadcast_sum(np.ones_like(odds))
+
+    result = np.repeat(odds[:, None], len(scenarios), axis=1)
+
+    # --- noise ---
+    cols = np.flatnonzero(kind == 'noise')
+    if len(cols):
+        rng = np.random.default_rng(seed)
+        z = rng.standard_normal((len(odds), len(cols)))
+        sigma = param[cols][None, :]
+        result[:, cols] = np.maximum(odds[:, None] * np.exp(sigma * z - sigma ** 2 / 2), 1.0)
+
+    # --- takeout_drift ---
+    cols = np.flatnonzero(kind == 'takeout_drift')
+    if len(cols):
+        d = param[cols][None, :]
+        shifted = np.maximum(prob[:, None] - d * (prob[:, None] - 1.0 / field_size[:, None]), 1e-6)
+        shifted /= groups.broadcast_sum(shifted)
+        result[:, cols] = 1.0 / (shifted * book[:, None])
+
+    # --- favourite_longshot ---
+    cols = np.flatnonzero(kind == 'favourite_longshot')
+    if len(cols):
+        powered = prob[:, None] ** param[cols][None, :]
+        powered /= groups.broadcast_sum(powered)
+        result[:, cols] = 1.0 / (powered * book[:, None])
+
+    return result
+
+
+def evaluate_scenarios(
+    df: pd.DataFrame,
+    scenarios: pd.DataFrame,
+    bet_threshold: float,
+    win_rate_threshold: float,
+    race_budget: int = 100,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    全シナリオの買い目選択と ROI を、(行数, シナリオ数) の配列演算1回で評価する。
+
+    買い目の選択と賭け金配分は calculate_roi と同じで、期待値だけ購入時オッズで計算する。
+    払戻は確定オッズで行う。予測勝率は固定（avg_odds 特徴量は確定オッズのまま）。
+    """
+    groups = _RaceGroups(df['race_id'])
+    odds_pre = perturb_odds(df, scenarios, seed)
+
+    win_rate = df['predicted_win_rate'].to_numpy(dtype=float)[:, None]
+    is_win = (df['label'].to_numpy() == 3)[:, None]
+    odds_final = df['odds'].to_numpy(dtype=float)[:, None]
+
+    mask = (win_rate * odds_pre > bet_threshold) & (win_rate > win_rate_threshold)
+    bet_rate = np.where(mask, win_rate, 0.0)
+    prob_sums = groups.broadcast_sum(bet_rate)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bet_amount = np.where(mask, race_budget * bet_rate / prob_sums, 0.0)
+    returns = np.where(mask & is_win, bet_amount * odds_final, 0.0)
+
+    bet_races = (groups.sum(mask.astype(int)) > 0).sum(axis=0)
+    total_investment = bet_races * race_budget
+    total_return = returns.sum(axis=0)
+
+    result = scenarios.copy()
+    result['bet_races'] = bet_races
+    result['num_bets'] = mask.sum(axis=0)
+    result['total_investment'] = total_investment
+    result['total_return'] = total_return
+    result['roi'] = np.where(total_investment > 0, total_return / np.maximum(total_investment, 1) * 100, 0.0)
+
+    baseline = result.loc[result['kind'] == 'identity', 'roi']
+    if not baseline.empty:
+        result['roi_delta'] = result['roi'] - baseline.iloc[0]
+    return result
+
+
+def summarize_scenarios(result: pd.DataFrame) -> pd.DataFrame:
+    """kind × param ごとに ROI の平均・最小・最大と賭けレース数の平均をまとめる。"""
+    return result.groupby(['kind', 'param'], sort=False).agg(
+        roi_mean=('roi', 'mean'),
+        roi_min=('roi', 'min'),
+        roi_max=('roi', 'max'),
+        bet_races=('bet_races', 'mean'),
+    ).reset_index()
+
+
+def main(
+    bet_threshold: float | None = None,
+    win_rate_threshold: float | None = None,
+    use_ensemble: bool = False,
+    storage: str | None = None,
+):
+    print("--- 購入時オッズの変動に対する感度分析を開始します ---")
+
+    print("1. モデルとデータを読み込み中...")
+    try:
+        model = load_model(use_ensemble)
+    except FileNotFoundError:
+        print(f"エラー: モデルファイルが見つかりません。")
+        return
+
+    _, df_untouched = load_and_split_data(DATA_PATH, TRAIN_RATIO)
+    if df_untouched.empty:
+        return
+
+    available_features = [f for f in FEATURE_COLS if f in df_untouched.columns]
+
+    print("2. スコア予測と期待値(EV)を計算中...")
+    df_untouched = add_predictions(df_untouched, model, available_features)
+
+    # backtest.py と同じく後半50%（閾値の探索に使っていない側）で評価する
+    df_optuna, df_test = split_optuna_test(df_untouched)
+
+    # 閾値の指定がなければ、backtest.py で探索済みの study の best_params を使う
+    if bet_threshold is None or win_rate_threshold is None:
+        study_name = backtest_study_name(df_optuna, df_untouched['race_id'].nunique())
+        best_params = load_best_params(study_name, storage)
+        if best_params is None:
+            print(f"エラー: study '{study_name}' が見つかりません。先に backtest.py を実行するか、閾値を指定してください。")
+            return
+        print(f"> study '{study_name}' の best_params を使います: {best_params}")
+        bet_threshold = best_params['bet_threshold'] if bet_threshold is None else bet_threshold
+        win_rate_threshold = best_params['win_rate_threshold'] if win_rate_threshold is None else win_rate_threshold
+
+    scenarios = build_scenarios()
+    print(f"3. {len(scenarios)} シナリオ × {len(df_test)} 頭を一括評価中...")
+    result = evaluate_scenarios(df_test, scenarios, bet_threshold, win_rate_threshold)
+
+    print(f"\n--- シナリオ別 ROI（bet_threshold={bet_threshold}, win_rate_threshold={win_rate_threshold}）---")
+    print(summarize_scenarios(result).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bet-threshold", type=float, default=None, help="期待値の閾値（省略時は backtest.py の study の best_params）")
+    parser.add_argument("--win-rate-threshold", type=float, default=None, help="予測勝率の閾値（省略時は backtest.py の study の best_params）")
+    parser.add_argument("--ensemble", action="store_true", help="シードアンサンブル（train.py --ensemble-size）で予測する")
+    parser.add_argument("--storage", type=str, default=None, help="backtest.py と同じ study の保存先（ジャーナルファイルのパス or sqlite:/// 形式のURL）")
+    args = parser.parse_args()
+    main(args.bet_threshold, args.win_rate_threshold, args.ensemble, args.storage)
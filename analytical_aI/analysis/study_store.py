@@ -0,0 +1,137 @@
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+import optuna
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import CACHE_DIR
+
+# 既定の保存先: 複数プロセスから同時に書き込めるジャーナルファイル
+DEFAULT_STORAGE = CACHE_DIR / 'optuna' / 'studies.log'
+
+
+def get_storage(storage=None):
+    """
+    Optuna の永続ストレージを返す。
+
+    storage:
+        None                  : DEFAULT_STORAGE のジャーナルファイル
+        "sqlite:///..." など  : RDB の URL（そのまま Optuna に渡す）
+        それ以外のパス        : ジャーナルファイル
+    """
+    storage = str(storage or DEFAULT_STORAGE)
+    if "://" in storage:
+        return storage
+
+    os.makedirs(os.path.dirname(os.path.abspath(storage)), exist_ok=True)
+    try:
+        from optuna.storages.journal import JournalFileBackend
+    except ImportError:  # optuna < 4.0
+        from optuna.storages import JournalFileStorage as JournalFileBackend
+    return optuna.storages.JournalStorage(JournalFileBackend(storage))
+
+
+def make_study_name(prefix: str, *fingerprints: str) -> str:
+    """モデル・データ・設定の指紋から決定的な study 名を作る。"""
+    return "-".join([prefix] + [fp[:12] for fp in fingerprints])
+
+
+def count_completed_trials(study: optuna.Study) -> int:
+    return len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)))
+
+
+def _optimize_worker(study_name: str, storage, objective, n_trials: int, direction: str, seed: int | None, constant_liar: bool) -> int:
+    """1プロセス分のワーカー。完了 trial が n_trials に達するまで共有 study を最適化する。"""
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = optuna.create_study(
+        study_name=study_name,
+        storage=get_storage(storage),
+        direction=direction,
+        sampler=optuna.samplers.TPESampler(seed=seed, constant_liar=constant_liar),
+        load_if_exists=True,
+    )
+    if count_completed_trials(study) >= n_trials:
+        return 0
+    study.optimize(
+        objective,
+        callbacks=[MaxTrialsCallback(n_trials, states=(TrialState.COMPLETE,))],
+    )
+    return count_completed_trials(study)
+
+
+def run_study(
+    study_name: str,
+    objective,
+    n_trials: int,
+    direction: str = "maximize",
+    storage=None,
+    seed: int | None = None,
+    n_workers: int = 1,
+) -> optuna.Study:
+    """
+    永続ストレージ上の study を作成 or 再開し、完了 trial 数が n_trials になるまで最適化する。
+
+    - 中断された study は完了済み trial を引き継いで残りだけを実行する
+    - 既に n_trials 件完了していれば最適化せずにそのまま返す
+    - n_workers > 1 のときは複数プロセスで同じ study を共有して探索する
+      （objective はプロセス間で受け渡すため pickle 可能である必要がある）
+    - 別々に起動したプロセスも、同じ study 名・ストレージを指定すれば同じ study と trial 数の上限を共有できる
+      （終了間際に実行中だった trial の分だけ n_trials をわずかに超えることがある）
+    """
+    study = optuna.create_study(
+        study_name=study_name,
+        storage=get_storage(storage),
+        direction=direction,
+        sampler=optuna.samplers.TPESampler(seed=seed),
+        load_if_exists=True,
+    )
+
+    completed = count_completed_trials(study)
+    if completed >= n_trials:
+        print(f"> study '{study_name}' は完了済み（{completed} trials）のため再利用します。")
+        return study
+    if completed > 0:
+        print(f"> study '{study_name}' を再開します（完了済み {completed} / {n_trials} trials）。")
+
+    if n_workers <= 1:
+        # 別々に起動したプロセスが同じ study を探索していても、完了 trial の合計が n_trials で止まるようにする。
+        # 後から参加したプロセスは既存 trial 数だけシードをずらし、constant_liar で実行中 trial との重複を避ける
+        offset = len(study.get_trials(deepcopy=False))
+        study.sampler = optuna.samplers.TPESampler(
+            seed=None if seed is None else seed + offset, constant_liar=True,
+        )
+        study.optimize(
+            objective,
+            callbacks=[MaxTrialsCallback(n_trials, states=(TrialState.COMPLETE,))],
+        )
+        return study
+
+    # ワーカーごとにシードをずらし、constant_liar で実行中 trial との重複探索を避ける
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(
+                _optimize_worker, study_name, storage, objective, n_trials, direction,
+                None if seed is None else seed + i, True,
+            )
+            for i in range(n_workers)
+        ]
+        for future in futures:
+            future.result()
+
+    return optuna.load_study(study_name=study_name, storage=get_storage(storage))
+
+
+def load_best_params(study_name: str, storage=None) -> dict | None:
+    """保存済み study の best_params を返す。study がない / 完了 trial がなければ None。"""
+    try:
+        study = optuna.load_study(study_name=study_name, storage=get_storage(storage))
+    except KeyError:
+        return None
+    if count_completed_trials(study) == 0:
+        return None
+    return study.best_params
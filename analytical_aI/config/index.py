@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
@@ -7,4 +8,17 @@ DATA_PATH = (CONFIG_DIR / '../../functions/scrape/racedata').resolve()
 MODELS_DIR = (PROJECT_ROOT / 'models').resolve()
 
 # 全データをrace_id昇順でソートしたときの学習用比率（残りはバックテスト用）
-TRAIN_RATIO = 0.8
\ No newline at end of file
+TRAIN_RATIO = 0.8
+
+# 中間生成物（Optunaのstudy・特徴量キャッシュなど）の保存先
+CACHE_DIR = (PROJECT_ROOT / 'cache').resolve()
+
+# 開発モード: レースを決定的にサンプリングして高速に試行する（未設定なら全データ）
+#   DEV_SAMPLE_FRAC=0.1           → 全レースの10%
+#   DEV_RACE_WINDOW=2022:2023     → race_id の先頭が 2022〜2023 のレースのみ（start:end の前方一致・両端含む）
+#   DEV_RACE_WINDOW=2023          → 2023:2023 と同じ
+DEV_SAMPLE_FRAC = float(os.environ["DEV_SAMPLE_FRAC"]) if os.environ.get("DEV_SAMPLE_FRAC") else None
+DEV_RACE_WINDOW = None
+if os.environ.get("DEV_RACE_WINDOW"):
+    _start, _, _end = os.environ["DEV_RACE_WINDOW"].partition(":")
+    DEV_RACE_WINDOW = (_start, _end or _start)
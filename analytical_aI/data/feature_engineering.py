@@ -142,3 +142,23 @@ def calculate_historical_pci(df: pd.DataFrame) -> pd.DataFrame:
     df["past_rpci"] = past_rpci.reindex(work.index).fillna(50.0)
 
     return df
+
+
+def calculate_load_ratio(df: pd.DataFrame) -> pd.Series:
+    """斤量体重比（斤量 / 馬体重）を返す。"""
+    return df["weight_carried"] / df["horse_weight"]
+
+
+def calculate_field_size(df: pd.DataFrame) -> pd.Series:
+    """出走頭数を返す。"""
+    return df.groupby("race_id")["race_id"].transform("count")
+
+
+def calculate_avg_odds(df: pd.DataFrame) -> pd.Series:
+    """レース内の単勝平均オッズ（混戦度）を返す。"""
+    return df.groupby("race_id")["odds"].transform("mean")
+
+
+def calculate_jockey_win_rate_relative(df: pd.DataFrame) -> pd.Series:
+    """騎手勝率のレース内偏差を返す。"""
+    return df["jockey_win_rate"] - df.groupby("race_id")["jockey_win_rate"].transform("mean")
@@ -0,0 +1,261 @@
+import os
+import hashlib
+import inspect
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+
+from analytical_aI.config.index import CACHE_DIR
+from analytical_aI.data.fingerprint import fingerprint_frame
+from analytical_aI.data.feature_engineering import (
+    calculate_jockey_win_rate, calculate_last3f_zscore, calculate_historical_pci,
+    calculate_jockey_track_win_rate, calculate_prev_time_diff, calculate_prev_rank_ratio,
+    calculate_load_ratio, calculate_field_size, calculate_avg_odds, calculate_jockey_win_rate_relative,
+)
+
+FEATURE_CACHE_DIR = CACHE_DIR / 'features'
+
+# 特徴量ごとに残すキャッシュの数（最近使ったものから）。データ更新や開発用サンプルごとに
+# 全行分の pickle が増え続けないよう、これを超えた古いキーは削除する
+FEATURE_CACHE_KEEP = 4
+
+# 特徴量を計算するタイミング
+#   pre_filter  : odds / rank による行の除外より前（除外された行も騎乗履歴として数える）
+#   post_filter : 行の除外後
+STAGES = ("pre_filter", "post_filter")
+
+# name -> {"func", "inputs", "outputs", "stage"}
+FEATURE_REGISTRY: dict[str, dict] = {}
+
+
+def register_feature(
+    name: str,
+    func,
+    inputs: list[str],
+    outputs: list[str] | None = None,
+    stage: str = "post_filter",
+    race_local: bool = False,
+) -> None:
+    """
+    特徴量を登録する。
+
+    func は df[inputs] のコピーを受け取り、outputs が1列なら Series、複数列なら
+    outputs の列を含む DataFrame を返す。inputs のうち df に存在しない列は無視されるため、
+    "jockey_id" / "jockey" のような代替列は両方書いておけばよい。
+    race_local=True は「そのレース自身の行だけから計算できる」（過去レースを参照しない）特徴量で、
+    1レース分の行だけを渡して再計算してよい。
+    """
+    if stage not in STAGES:
+        raise ValueError(f"stage は {STAGES} のいずれかを指定してください: {stage}")
+    FEATURE_REGISTRY[name] = {
+        "func": func,
+        "inputs": list(inputs),
+        "outputs": list(outputs or [name]),
+        "stage": stage,
+        "race_local": race_local,
+    }
+
+
+def _producers() -> dict[str, str]:
+    """出力列名 -> その列を作る特徴量名"""
+    return {col: name for name, spec in FEATURE_REGISTRY.items() for col in spec["outputs"]}
+
+
+def feature_dependencies(name: str) -> set[str]:
+    """特徴量が直接依存する（入力列を作る）特徴量名の集合を返す。"""
+    producers = _producers()
+    return {producers[col] for col in FEATURE_REGISTRY[name]["inputs"] if col in producers} - {name}
+
+
+def resolve_features(columns: list[str]) -> list[str]:
+    """
+    要求された列を作るのに必要な特徴量を、依存関係を含めてトポロジカル順で返す。
+    依存関係で順序が決まらないものは登録順に並べる。
+    登録されていない列（生データの列など）は無視する。
+    """
+    producers = _producers()
+    needed: set[str] = set()
+    stack = [producers[c] for c in columns if c in producers]
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(feature_dependencies(name))
+
+    graph = {name: feature_dependencies(name) for name in FEATURE_REGISTRY if name in needed}
+    for name, deps in graph.items():
+        for dep in deps:
+            if STAGES.index(FEATURE_REGISTRY[dep]["stage"]) > STAGES.index(FEATURE_REGISTRY[name]["stage"]):
+                raise ValueError(f"'{name}' が後段の特徴量 '{dep}' に依存しています。")
+
+    order: list[str] = []
+    while graph:
+        ready = next((name for name, deps in graph.items() if deps <= set(order)), None)
+        if ready is None:
+            raise ValueError(f"特徴量の依存関係が循環しています: {sorted(graph)}")
+        order.append(ready)
+        del graph[ready]
+    return order
+
+
+def feature_dependents(columns: list[str]) -> list[str]:
+    """指定した列を（推移的に）入力に持つ特徴量名を、トポロジカル順で返す。"""
+    affected: set[str] = set()
+    changed = set(columns)
+    while True:
+        new = {
+            name for name, spec in FEATURE_REGISTRY.items()
+            if name not in affected and changed & set(spec["inputs"])
+        }
+        if not new:
+            break
+        affected |= new
+        changed |= {col for name in new for col in FEATURE_REGISTRY[name]["outputs"]}
+    return [name for name in resolve_features(list(changed)) if name in affected]
+
+
+def apply_features(df: pd.DataFrame, names: list[str]) -> pd.DataFrame:
+    """
+    指定した特徴量だけを、依存関係の解決やキャッシュなしで順に再計算して df を更新する。
+    上流の特徴量列は df に揃っている前提（レース直前の差分更新など少数行向け）。
+    """
+    for name in names:
+        spec = FEATURE_REGISTRY[name]
+        result = spec["func"](df[[c for c in spec["inputs"] if c in df.columns]].copy())
+        if isinstance(result, pd.Series):
+            result = result.to_frame(spec["outputs"][0])
+        for col in spec["outputs"]:
+            df[col] = result[col].reindex(df.index)
+    return df
+
+
+def _cache_key(name: str, inputs: pd.DataFrame) -> str:
+    """特徴量関数のソースコードと入力列の内容から、キャッシュキーを作る。"""
+    spec = FEATURE_REGISTRY[name]
+    digest = hashlib.sha256()
+    digest.update(name.encode())
+    digest.update(inspect.getsource(spec["func"]).encode())
+    digest.update(repr((spec["inputs"], spec["outputs"])).encode())
+    digest.update(fingerprint_frame(inputs).encode())
+    return digest.hexdigest()
+
+
+def _prune_cache(feature_dir: str, keep: int) -> None:
+    """特徴量のキャッシュを、最終利用（更新時刻）が新しい keep 個だけ残して削除する。"""
+    entries = []
+    for entry in os.scandir(feature_dir):
+        if entry.name.endswith(".pkl"):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    for _, path in sorted(entries, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # 他のプロセスが先に削除した
+            pass
+
+
+def _compute_one(name: str, inputs: pd.DataFrame, cache_dir, keep: int = FEATURE_CACHE_KEEP) -> pd.DataFrame:
+    """1つの特徴量を計算する（キャッシュがあれば読み込む）。"""
+    spec = FEATURE_REGISTRY[name]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, name, f"{_cache_key(name, inputs)}.pkl")
+        try:
+            result = pd.read_pickle(cache_path)
+            # 最近使ったキャッシュとして残るよう、更新時刻を進める
+            os.utime(cache_path)
+            return result
+        except FileNotFoundError:
+            pass
+
+    result = spec["func"](inputs)
+    if isinstance(result, pd.Series):
+        result = result.to_frame(spec["outputs"][0])
+    result = result[spec["outputs"]]
+
+    if cache_path is not None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        result.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+        _prune_cache(os.path.dirname(cache_path), keep)
+    return result
+
+
+def compute_features(
+    df: pd.DataFrame,
+    columns: list[str],
+    stage: str | None = None,
+    max_workers: int | None = None,
+    cache_dir=FEATURE_CACHE_DIR,
+) -> pd.DataFrame:
+    """
+    要求された列に必要な特徴量だけを計算して df に追加する。
+
+    - 依存関係が解決した特徴量から順にスレッドで並列実行する
+    - 各特徴量の出力は「関数のソース + 入力列の内容」をキーに個別にキャッシュするため、
+      1つの特徴量を書き換えるとその特徴量と、出力が変わった下流の特徴量だけが再計算される
+    - stage を指定した場合はその段階の特徴量だけを計算する（前段の特徴量は計算済みである前提）
+    - キャッシュは特徴量ごとに最近使った FEATURE_CACHE_KEEP 個だけ残す
+    - cache_dir=None でキャッシュを無効化
+    """
+    names = [n for n in resolve_features(columns) if stage is None or FEATURE_REGISTRY[n]["stage"] == stage]
+    if not names:
+        return df
+
+    pending = {name: feature_dependencies(name) & set(names) for name in names}
+    done: set[str] = set()
+    max_workers = max_workers or min(len(names), os.cpu_count() or 1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            for name in [n for n, deps in pending.items() if deps <= done]:
+                del pending[name]
+                inputs = df[[c for c in FEATURE_REGISTRY[name]["inputs"] if c in df.columns]].copy()
+                running[executor.submit(_compute_one, name, inputs, cache_dir)] = name
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                result = future.result()
+                # 列の追加はメインスレッドだけで行う（実行中のタスクは入力のコピーを参照している）
+                for col in FEATURE_REGISTRY[name]["outputs"]:
+                    df[col] = result[col].reindex(df.index)
+                done.add(name)
+
+    # 完了順に依らず、列の並びを依存順に揃える
+    new_cols = [col for name in names for col in FEATURE_REGISTRY[name]["outputs"]]
+    return df[[c for c in df.columns if c not in new_cols] + new_cols]
+
+
+# ---------------------------------------------------------------------------
+# 特徴量の登録（入力列・出力列・計算タイミング）
+# ---------------------------------------------------------------------------
+# 騎手勝率（直近50走ローリング、shift(1)でリーク防止）: 除外前の全騎乗を履歴として数える
+register_feature("jockey_win_rate", calculate_jockey_win_rate, ["jockey_id", "jockey", "race_id", "rank"], stage="pre_filter")
+# 上がり3ハロン
+register_feature("last_3f_zscore", calculate_last3f_zscore, ["horse_id", "race_id", "last_3f"])
+# 斤量体重比
+register_feature("load_ratio", calculate_load_ratio, ["weight_carried", "horse_weight"], race_local=True)
+# 出走頭数
+register_feature("field_size", calculate_field_size, ["race_id"], race_local=True)
+# 単勝平均オッズ（レースの混戦度）
+register_feature("avg_odds", calculate_avg_odds, ["race_id", "odds"], race_local=True)
+# PCI・RPCI の過去近走平均（精度低下のため FEATURE_COLS からは外している）
+register_feature(
+    "historical_pci", calculate_historical_pci,
+    ["horse_id", "race_id", "time", "last_3f", "distance"], outputs=["past_pci", "past_rpci"],
+)
+# 騎手×コース種別の過去勝率
+register_feature("jockey_track_win_rate", calculate_jockey_track_win_rate, ["jockey_id", "jockey", "track_type", "race_id", "rank"])
+# 前走の1着馬とのタイム差
+register_feature("prev_time_diff", calculate_prev_time_diff, ["horse_id", "race_id", "time", "label"])
+# 前走の着順割合
+register_feature("prev_rank_ratio", calculate_prev_rank_ratio, ["horse_id", "race_id", "rank", "field_size"])
+# 相対特徴量: 騎手勝率のレース内偏差
+register_feature("jockey_win_rate_relative", calculate_jockey_win_rate_relative, ["race_id", "jockey_win_rate"], race_local=True)
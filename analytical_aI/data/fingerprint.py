@@ -0,0 +1,44 @@
+import hashlib
+import json
+import pandas as pd
+
+
+def fingerprint_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint_file(path) -> str:
+    """ファイル内容の SHA-256 を返す（学習済みモデルの joblib など）。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_model(model) -> str:
+    """
+    学習済みモデルの内容から指紋を作る。
+
+    LGBMRanker / Booster / SeedEnsemble（boosters 属性を持つもの）に対応し、
+    モデル文字列が同じなら同じ指紋になる。
+    """
+    if hasattr(model, "boosters"):
+        return fingerprint_bytes("".join(fingerprint_model(b) for b in model.boosters).encode())
+    booster = model.booster_ if hasattr(model, "booster_") else model
+    return fingerprint_bytes(booster.model_to_string().encode())
+
+
+def fingerprint_frame(df: pd.DataFrame, columns: list[str] | None = None) -> str:
+    """DataFrame の指定列（省略時は全列）の値とインデックスから指紋を作る。"""
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    digest = hashlib.sha256()
+    digest.update(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_params(params: dict) -> str:
+    """探索範囲などの設定値（JSON 化できる dict）から指紋を作る。"""
+    return fingerprint_bytes(json.dumps(params, sort_keys=True, default=str).encode())
@@ -1,8 +1,10 @@
 import os
 import json
+import hashlib
 import pandas as pd
 
 from .preprocessor import preprocess_data
+from analytical_aI.config.index import DEV_SAMPLE_FRAC, DEV_RACE_WINDOW
 
 
 def load_and_process_race_data(data_path: str) -> list[dict]:
@@ -59,27 +61,119 @@ def load_and_process_race_data(data_path: str) -> list[dict]:
     return all_horse_data
 
 
-def load_and_preprocess_data(data_path: str) -> tuple[pd.DataFrame, list[int]]:
-    """データ読み込みから前処理まで一括で行う。"""
+def _race_sample_value(race_id: str, sample_seed: int = 0) -> float:
+    """race_id から [0, 1) の決定的な値を作る（データが増えても既存レースの採否は変わらない）。"""
+    digest = hashlib.md5(f"{sample_seed}:{race_id}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def select_dev_records(
+    raw_data: list[dict],
+    sample_frac: float | None = None,
+    race_window: tuple[str, str] | None = None,
+    sample_seed: int = 0,
+) -> tuple[list[dict], set[str]]:
+    """
+    開発用にレースを決定的にサンプリングし、履歴特徴量の計算に必要なレコードだけを残す。
+
+    対象レースは race_window（race_id の前方一致 start〜end、両端含む）と
+    sample_frac（race_id のハッシュによる抽出率）で選ぶ。
+    shift(1) ベースの履歴特徴量を全データ時と同じ値にするため、以下も残す:
+        - 対象馬が出走した過去レース（レース単位で全頭。Z-score・1着タイム・頭数に必要）
+        - 対象騎手の過去の騎乗レコード（騎手勝率・騎手×コース勝率に必要）
+
+    Returns:
+        tuple[list[dict], set[str]]: (残したレコード, 対象レースの race_id 集合)
+    """
+    race_ids = sorted({str(r["race_id"]) for r in raw_data})
+    targets = set(race_ids)
+    if race_window is not None:
+        start, end = race_window
+        targets = {r for r in targets if r[:len(start)] >= start and r[:len(end)] <= end}
+    if sample_frac is not None:
+        targets = {r for r in targets if _race_sample_value(r, sample_seed) < sample_frac}
+
+    # 馬・騎手ごとに「最後の対象レース」を求め、それより前の履歴だけを残す
+    last_horse_target: dict = {}
+    last_jockey_target: dict = {}
+    for record in raw_data:
+        race_id = str(record["race_id"])
+        if race_id not in targets:
+            continue
+        jockey = record.get("jockey_id", record.get("jockey"))
+        if race_id > last_horse_target.get(record.get("horse_id"), ""):
+            last_horse_target[record.get("horse_id")] = race_id
+        if race_id > last_jockey_target.get(jockey, ""):
+            last_jockey_target[jockey] = race_id
+
+    history_races = {
+        str(r["race_id"]) for r in raw_data
+        if str(r["race_id"]) < last_horse_target.get(r.get("horse_id"), "")
+    }
+    keep_races = targets | history_races
+
+    records = [
+        r for r in raw_data
+        if str(r["race_id"]) in keep_races
+        or str(r["race_id"]) < last_jockey_target.get(r.get("jockey_id", r.get("jockey")), "")
+    ]
+
+    print(
+        f"🧪 開発モード: 対象 {len(targets)} / {len(race_ids)} レース"
+        f"（履歴込み {len(records)} / {len(raw_data)} レコード）"
+    )
+    return records, targets
+
+
+def load_and_preprocess_data(
+    data_path: str,
+    sample_frac: float | None = None,
+    race_window: tuple[str, str] | None = None,
+) -> tuple[pd.DataFrame, list[int]]:
+    """
+    データ読み込みから前処理まで一括で行う。
+
+    sample_frac / race_window を指定すると開発モードになり、対象レースとその履歴だけを
+    前処理したうえで対象レースの行のみを返す（詳細は select_dev_records）。
+    欠損値の平均補完は残したレコードの平均で行うため、その値のみ全データ時と異なり得る。
+    """
     raw_data = load_and_process_race_data(data_path)
 
     if not raw_data:
         print("生データが見つからなかったため、空のDataFrameを返します。")
         return pd.DataFrame(), []
 
-    df, group_data = preprocess_data(raw_data)
+    if sample_frac is None and race_window is None:
+        df, group_data = preprocess_data(raw_data)
+        return df, group_data
+
+    raw_data, targets = select_dev_records(raw_data, sample_frac, race_window)
+    df, _ = preprocess_data(raw_data)
+    if df.empty:
+        return df, []
+
+    df = df[df["race_id"].astype(str).isin(targets)].reset_index(drop=True)
+    group_data: list[int] = df.groupby("race_id", sort=False).size().tolist()
     return df, group_data
 
 
-def load_and_split_data(data_path: str, train_ratio: float = 0.8) -> tuple[pd.DataFrame, pd.DataFrame]:
+def load_and_split_data(
+    data_path: str,
+    train_ratio: float = 0.8,
+    sample_frac: float | None = DEV_SAMPLE_FRAC,
+    race_window: tuple[str, str] | None = DEV_RACE_WINDOW,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     全データを一括で前処理したあと、race_id昇順でtrain/unseenに分割して返す。
     騎手勝率は shift(1) ベースのローリング集計のため全データで一括処理してよい。
 
+    sample_frac / race_window（既定値は環境変数 DEV_SAMPLE_FRAC / DEV_RACE_WINDOW）を指定すると
+    開発モードとなり、サンプリングしたレースだけを同じ手順で分割する。
+
     Returns:
         tuple[pd.DataFrame, pd.DataFrame]: (学習用df, 未知データdf)
     """
-    df, _ = load_and_preprocess_data(data_path)
+    df, _ = load_and_preprocess_data(data_path, sample_frac, race_window)
     if df.empty:
         return pd.DataFrame(), pd.DataFrame()
 
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 
-from analytical_aI.data.feature_engineering import calculate_jockey_win_rate, calculate_last3f_zscore, calculate_historical_pci, calculate_jockey_track_win_rate, calculate_prev_time_diff, calculate_prev_rank_ratio
+from analytical_aI.data.feature_registry import FEATURE_CACHE_DIR, compute_features
 
 
 # ---------------------------------------------------------------------------
@@ -52,11 +52,27 @@ def _get_relevance_score(rank) -> int:
         return 0
 
 
-def preprocess_data(raw_data: list[dict]) -> tuple[pd.DataFrame, list[int]]:
-    """生のレースデータを LambdaRank 学習用 DataFrame に変換する。"""
+def preprocess_data(
+    raw_data: list[dict],
+    feature_cols: list[str] | None = None,
+    use_cache: bool = True,
+    card_race_ids: set[str] | None = None,
+) -> tuple[pd.DataFrame, list[int]]:
+    """
+    生のレースデータを LambdaRank 学習用 DataFrame に変換する。
+
+    特徴量は feature_registry の登録内容に従い、feature_cols（省略時は FEATURE_COLS）に
+    必要なものだけを依存順に計算する。use_cache=False で特徴量キャッシュを使わない。
+
+    card_race_ids に含まれるレースは出馬表（未実施レース）として扱い、着順・オッズがなくても
+    行を残す（label は NaN）。過去走の特徴量はそれ以前のレース結果から計算される。
+    """
     if not raw_data:
         return pd.DataFrame(), []
 
+    feature_cols = FEATURE_COLS if feature_cols is None else feature_cols
+    cache_dir = FEATURE_CACHE_DIR if use_cache else None
+
     # --- 2. DataFrame 化 ---
     df = pd.DataFrame(raw_data)
 
@@ -73,56 +89,36 @@ def preprocess_data(raw_data: list[dict]) -> tuple[pd.DataFrame, list[int]]:
     # --- 4. sex のエンコード（カテゴリ変数として扱うため文字列を保持） ---
     # LightGBM category 型で直接扱う → 日本語文字列のまま category にキャスト
 
-    # --- 5. 騎手勝率を付与（直近50走ローリング、shift(1)でリーク防止）---
-    df["jockey_win_rate"] = calculate_jockey_win_rate(df)
+    # --- 5. 行の除外前に計算する特徴量（騎手勝率など）---
+    df = compute_features(df, feature_cols, stage="pre_filter", cache_dir=cache_dir)
 
     # --- 6. 目的変数: relevance score（LambdaRank 用） ---
     df["label"] = df["rank"].apply(_get_relevance_score)
+    is_card = df["race_id"].astype(str).isin(card_race_ids or ())
+    if is_card.any():
+        df.loc[is_card, "label"] = np.nan
 
     # --- 7. 不要行の除去 ---
     # rank が解釈不能（取消・除外など）は既に label=0 だが、
     # odds が 0 / NaN の行は期待値計算で使えないため除外
-    df = df[df["odds"].notna() & (df["odds"] > 0)].copy()
-    df.dropna(subset=["rank", "horse_number"], inplace=True)
-    df["rank"] = df["rank"].astype(int)
-
-    # --- . 上がり3ハロンを付与 ---
-    df["last_3f_zscore"] = calculate_last3f_zscore(df)
-
-    # --- . 斤量体重比を付与 ---
-    df["load_ratio"] = df["weight_carried"] / df["horse_weight"]
-
-    # --- . 出走頭数を付与 ---
-    df["field_size"] = df.groupby("race_id")["race_id"].transform("count")
-
-    # --- . 単勝平均オッズを付与（レースの混戦度） ---
-    df["avg_odds"] = df.groupby("race_id")["odds"].transform("mean")
-
-    # # --- . PCI・RPCI の過去近走平均を付与（精度低下のため一時無効化）---
-    # df = calculate_historical_pci(df)
-
-    # --- . 騎手×コース種別の過去勝率を付与 ---
-    df["jockey_track_win_rate"] = calculate_jockey_track_win_rate(df)
-
-    # --- . 前走の1着馬とのタイム差を付与 ---
-    df["prev_time_diff"] = calculate_prev_time_diff(df)
-
-    # --- . 前走の着順割合を付与（field_size の後に計算） ---
-    df["prev_rank_ratio"] = calculate_prev_rank_ratio(df)
+    # 出馬表の行は着順・オッズがまだないため残す
+    has_result = df["odds"].notna() & (df["odds"] > 0) & df["rank"].notna()
+    df = df[(has_result | is_card) & df["horse_number"].notna()].copy()
+    if not is_card.any():
+        df["rank"] = df["rank"].astype(int)
 
-    # --- . 相対特徴量: 騎手勝率のレース内偏差 ---
-    df["jockey_win_rate_relative"] = (
-        df["jockey_win_rate"] - df.groupby("race_id")["jockey_win_rate"].transform("mean")
-    )
+    # --- . 行の除外後に計算する特徴量（依存関係の順に、独立なものは並列に計算）---
+    df = compute_features(df, feature_cols, stage="post_filter", cache_dir=cache_dir)
 
     # --- 8. カテゴリ変数を category 型にキャスト ---
     for col in CAT_COLS:
         if col in df.columns:
             df[col] = df[col].astype("category")
 
-    # --- 9. 数値特徴量の欠損値を平均補完 ---
-    num_feature_cols = [c for c in FEATURE_COLS if c in df.columns and c not in CAT_COLS]
-    df[num_feature_cols] = df[num_feature_cols].fillna(df[num_feature_cols].mean())
+    # --- 9. 数値特徴量の欠損値を平均補完（平均は結果のあるレースの行で計算）---
+    num_feature_cols = [c for c in feature_cols if c in df.columns and c not in CAT_COLS]
+    has_result = ~df["race_id"].astype(str).isin(card_race_ids or ())
+    df[num_feature_cols] = df[num_feature_cols].fillna(df.loc[has_result, num_feature_cols].mean())
 
     # --- 10. race_id でソート（LambdaRank の絶対条件） ---
     df = df.sort_values(by=["race_id", "horse_number"]).reset_index(drop=True)
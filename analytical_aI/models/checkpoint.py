@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import lightgbm as lgb
+from lightgbm.callback import EarlyStopException
+
+from analytical_aI.config.index import CACHE_DIR
+
+CHECKPOINT_DIR = CACHE_DIR / 'checkpoints'
+
+MODEL_FILE = 'booster.txt'
+STATE_FILE = 'state.json'
+
+
+def _atomic_write(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(checkpoint_dir, booster: lgb.Booster, state: dict) -> None:
+    """ブースター（その時点の全ツリー）と早期終了の状態を保存する。モデル → 状態の順に置き換える。"""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    _atomic_write(os.path.join(checkpoint_dir, MODEL_FILE), booster.model_to_string(num_iteration=-1))
+    _atomic_write(os.path.join(checkpoint_dir, STATE_FILE), json.dumps(state, ensure_ascii=False))
+
+
+def load_checkpoint(checkpoint_dir) -> tuple[lgb.Booster | None, dict | None]:
+    """保存済みのチェックポイントを読み込む。なければ (None, None) を返す。"""
+    model_path = os.path.join(checkpoint_dir, MODEL_FILE)
+    state_path = os.path.join(checkpoint_dir, STATE_FILE)
+    if not (os.path.exists(model_path) and os.path.exists(state_path)):
+        return None, None
+
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    booster = lgb.Booster(model_file=model_path)
+    # 状態ファイルより後に書かれた余分なツリーは捨てる
+    if booster.current_iteration() > state["iteration"] + 1:
+        booster = lgb.Booster(model_str=booster.model_to_string(num_iteration=state["iteration"] + 1))
+    return booster, state
+
+
+def checkpointed_early_stopping(
+    checkpoint_dir,
+    stopping_rounds: int = 50,
+    checkpoint_every: int = 50,
+    time_budget: float | None = None,
+    state: dict | None = None,
+):
+    """
+    early_stopping の代わりに使うコールバック。
+
+    - 検証スコアが stopping_rounds 回改善しなければ終了（lightgbm.early_stopping と同じ判定）
+    - checkpoint_every イテレーションごとにブースターと早期終了の状態を保存する
+    - time_budget 秒を超えたら、その時点のチェックポイントを保存して最良イテレーションで終了する
+    - state に load_checkpoint の状態を渡すと、最良スコア・最良イテレーションを引き継いで再開できる
+
+    終了理由は state["stopped"] に "early_stopping" / "completed" / "time_budget"、
+    そのときの最良イテレーション（0始まり）は state["stopped_best_iteration"] に記録する。
+    """
+    state = dict(state or {})
+    state.setdefault("best_iteration", [])
+    state.setdefault("best_score", [])
+    state.setdefault("best_score_list", [])
+    state.setdefault("elapsed", 0.0)
+    state["stopped"] = None
+    started_at = time.time()
+    elapsed_before = state["elapsed"]
+
+    def _callback(env) -> None:
+        # 学習データ自身の評価は早期終了の判定に使わない
+        results = [tuple(r)[:4] for r in env.evaluation_result_list if r[0] != "training"]
+        if not results:
+            return
+
+        if not state["best_score"]:
+            state["best_score"] = [float("-inf") if r[3] else float("inf") for r in results]
+            state["best_iteration"] = [env.iteration] * len(results)
+            state["best_score_list"] = [results] * len(results)
+
+        for i, (_, _, score, higher_better) in enumerate(results):
+            if (score > state["best_score"][i]) if higher_better else (score < state["best_score"][i]):
+                state["best_score"][i] = score
+                state["best_iteration"][i] = env.iteration
+                state["best_score_list"][i] = results
+
+        stop_idx = None
+        for i in range(len(results)):
+            if env.iteration - state["best_iteration"][i] >= stopping_rounds:
+                state["stopped"], stop_idx = "early_stopping", i
+                break
+        if stop_idx is None and env.iteration == env.end_iteration - 1:
+            state["stopped"], stop_idx = "completed", 0
+        if stop_idx is None and time_budget is not None and time.time() - started_at >= time_budget:
+            state["stopped"], stop_idx = "time_budget", 0
+
+        state["iteration"] = env.iteration
+        if stop_idx is not None:
+            state["stopped_best_iteration"] = state["best_iteration"][stop_idx]
+        state["elapsed"] = elapsed_before + time.time() - started_at
+        if stop_idx is not None or (checkpoint_every > 0 and (env.iteration + 1) % checkpoint_every == 0):
+            save_checkpoint(checkpoint_dir, env.model, state)
+
+        if stop_idx is not None:
+            best_iteration = state["stopped_best_iteration"]
+            print(f"> 学習を終了します（{state['stopped']}）。最良イテレーション: [{best_iteration + 1}]")
+            raise EarlyStopException(best_iteration, [tuple(r) for r in state["best_score_list"][stop_idx]])
+
+    # lightgbm.early_stopping と同じ順序（log_evaluation より後）で呼ばれるようにする
+    _callback.order = 30
+    return _callback
+
+
+def restore_best_iteration(state: dict):
+    """
+    学習完了済みのチェックポイントを、通常の学習と同じ LGBMRanker として復元するためのコールバック。
+
+    最良イテレーションまでに切り詰めたブースターを init_model に渡し、n_estimators=1 で fit すると
+    最初のイテレーションで終了し、best_iteration_ / best_score_ が前回の最良値になる
+    （追加される1本のツリーは、早期終了後の余分なツリーと同様に predict では使われない）。
+    """
+    best_iteration = state["stopped_best_iteration"]
+    best_score_list = state["best_score_list"][state["best_iteration"].index(best_iteration)]
+
+    def _callback(env) -> None:
+        raise EarlyStopException(best_iteration, [tuple(r) for r in best_score_list])
+
+    _callback.order = 30
+    return _callback
@@ -0,0 +1,151 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from lightgbm.callback import early_stopping, log_evaluation
+from concurrent.futures import ThreadPoolExecutor
+from joblib import dump, load
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import MODELS_DIR
+from analytical_aI.data.preprocessor import CAT_COLS
+
+ENSEMBLE_PATH = MODELS_DIR / 'lambdarank_ensemble.joblib'
+SINGLE_MODEL_PATH = MODELS_DIR / 'lambdarank_model.joblib'
+
+# シードごとに行・特徴量をサンプリングして、メンバー間に違いを持たせる
+# （サンプリングなしでは random_state を変えても全く同じモデルになる）
+MEMBER_SAMPLING = {"subsample": 0.8, "subsample_freq": 1, "colsample_bytree": 0.8}
+
+
+def fit_seed_model(X_train, y_train, group_train, X_val, y_val, group_val, seed: int) -> lgb.LGBMRanker:
+    """train.py と同じ設定に MEMBER_SAMPLING を加えた LambdaRank モデルを、指定シードで1つ学習する。"""
+    model = lgb.LGBMRanker(
+        objective="lambdarank", metric="ndcg", boosting_type="gbdt",
+        n_estimators=1000, learning_rate=0.05, num_leaves=63,
+        importance_type="gain", random_state=seed, n_jobs=1,
+        **MEMBER_SAMPLING,
+    )
+    model.fit(
+        X_train, y_train, group=group_train,
+        eval_set=[(X_val, y_val)], eval_group=[group_val], eval_at=[3, 5],
+        categorical_feature=CAT_COLS,
+        callbacks=[early_stopping(stopping_rounds=50), log_evaluation(period=-1)],
+    )
+    return model
+
+
+class SeedEnsemble:
+    """
+    シード違いの LambdaRank モデル群を1つの成果物として扱うラッパー。
+
+    predict() は単体モデル（LGBMRanker）と同じ呼び出し方で平均スコアを返すため、
+    backtest.add_predictions などにそのまま渡せる。
+    特徴量行列の変換（category 型 → 数値コード）は全メンバーで1回だけ行い、
+    各メンバーの推論はスレッドで並列に実行する（LightGBM の推論は GIL を解放する）。
+    """
+
+    def __init__(self, models: list, seeds: list[int], features: list[str]):
+        if not models:
+            raise ValueError("アンサンブルには1つ以上のモデルが必要です。")
+        self.boosters = [m.booster_ if hasattr(m, 'booster_') else m for m in models]
+        self.seeds = list(seeds)
+        self.features = list(features)
+        # 全メンバーが同じ学習データから作られているため、カテゴリ定義は共通
+        self.pandas_categorical = self.boosters[0].pandas_categorical
+
+    def __len__(self) -> int:
+        return len(self.boosters)
+
+    def prepare_matrix(self, X: pd.DataFrame) -> np.ndarray:
+        """LightGBM が内部で行う pandas → 数値行列の変換を、学習時のカテゴリ定義で1回だけ行う。"""
+        X = X[self.features]
+        cat_cols = [c for c in X.columns if isinstance(X[c].dtype, pd.CategoricalDtype)]
+        categories = self.pandas_categorical or []
+
+        columns = {}
+        for col in X.columns:
+            if col in cat_cols and cat_cols.index(col) < len(categories):
+                codes = pd.Categorical(X[col], categories=categories[cat_cols.index(col)]).codes
+                columns[col] = np.where(codes < 0, np.nan, codes).astype(np.float64)
+            else:
+                columns[col] = pd.to_numeric(X[col], errors='coerce').to_numpy(dtype=np.float64)
+
+        return np.column_stack([columns[c] for c in X.columns]) if columns else np.empty((len(X), 0))
+
+    def predict_members(self, X, max_workers: int | None = None) -> np.ndarray:
+        """全メンバーの予測スコアを (メンバー数, 行数) の配列で返す。"""
+        matrix = X if isinstance(X, np.ndarray) else self.prepare_matrix(X)
+        max_workers = max_workers or min(len(self.boosters), os.cpu_count() or 1)
+
+        def _predict(booster):
+            # 並列実行時はメンバー内のスレッド数を1にして、メンバー間で並列化する
+            params = {'num_threads': 1} if max_workers > 1 else {}
+            return booster.predict(matrix, num_iteration=booster.best_iteration or None, **params)
+
+        if max_workers == 1:
+            return np.vstack([_predict(b) for b in self.boosters])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return np.vstack(list(executor.map(_predict, self.boosters)))
+
+    def predict(self, X, max_workers: int | None = None) -> np.ndarray:
+        """全メンバーの平均スコアを返す。"""
+        return self.predict_members(X, max_workers).mean(axis=0)
+
+
+def race_softmax(scores: np.ndarray, race_ids) -> np.ndarray:
+    """レースごとの softmax をグループ演算で一括計算する（race_id ごとに合計1）。"""
+    scores = pd.Series(np.asarray(scores, dtype=float))
+    race_ids = pd.Series(np.asarray(race_ids))
+    shifted = np.exp(scores - scores.groupby(race_ids).transform('max'))
+    return (shifted / shifted.groupby(race_ids).transform('sum')).to_numpy()
+
+
+def predict_ensemble(ensemble: SeedEnsemble, df: pd.DataFrame, max_workers: int | None = None) -> pd.DataFrame:
+    """
+    アンサンブルで df 全体を一括推論し、平均スコアとレース内 softmax 勝率を返す。
+
+    Returns:
+        pd.DataFrame: df と同じインデックスで predicted_score, predicted_score_std, predicted_win_rate 列を持つ
+    """
+    member_scores = ensemble.predict_members(df, max_workers)
+    scores = member_scores.mean(axis=0)
+    return pd.DataFrame({
+        'predicted_score': scores,
+        'predicted_score_std': member_scores.std(axis=0),
+        'predicted_win_rate': race_softmax(scores, df['race_id'].to_numpy()),
+    }, index=df.index)
+
+
+def train_seed_ensemble(X_train, y_train, group_train, X_val, y_val, group_val, seeds: list[int], max_workers: int | None = None) -> SeedEnsemble:
+    """シードごとのモデルを並列に学習し、SeedEnsemble にまとめて返す。"""
+    max_workers = max_workers or min(len(seeds), os.cpu_count() or 1)
+
+    def _fit(seed):
+        model = fit_seed_model(X_train, y_train, group_train, X_val, y_val, group_val, seed)
+        print(f"> seed={seed} 学習完了（最良イテレーション: {model.best_iteration_}）")
+        return model
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        models = list(executor.map(_fit, seeds))
+
+    return SeedEnsemble(models, seeds, list(X_train.columns))
+
+
+def save_ensemble(ensemble: SeedEnsemble, path=ENSEMBLE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dump(ensemble, path)
+    print(f"✅ {len(ensemble)} モデルのアンサンブルを '{path}' として保存しました。")
+
+
+def load_ensemble(path=ENSEMBLE_PATH) -> SeedEnsemble:
+    return load(path)
+
+
+def load_model(use_ensemble: bool = False):
+    """学習済みモデル（単体モデル or シードアンサンブル）を読み込む。なければ FileNotFoundError。"""
+    return load_ensemble(ENSEMBLE_PATH) if use_ensemble else load(SINGLE_MODEL_PATH)
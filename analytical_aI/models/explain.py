@@ -0,0 +1,233 @@
+import sys
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO, CACHE_DIR
+from analytical_aI.data.loader import load_and_split_data
+from analytical_aI.data.preprocessor import FEATURE_COLS
+from analytical_aI.data.fingerprint import fingerprint_model, fingerprint_frame
+from analytical_aI.models.ensemble import SeedEnsemble, load_model
+
+# 予測結果のキャッシュ。モデルの指紋ごとにディレクトリを分ける
+PREDICTION_CACHE_DIR = CACHE_DIR / 'predictions'
+
+# 残す寄与キャッシュの数（全モデル合計で、最近使ったものから）。モデルや未知データが変わるたびに
+# 全行分の行列が増え続けないよう、これを超えた古いものは削除する
+PREDICTION_CACHE_KEEP = 4
+
+
+def _as_ensemble(model, features: list[str]) -> SeedEnsemble:
+    """単体モデルもメンバー1つのアンサンブルとして扱い、行列変換を共通化する。"""
+    return model if isinstance(model, SeedEnsemble) else SeedEnsemble([model], [None], features)
+
+
+def race_offsets(race_ids) -> np.ndarray:
+    """race_id でソート済みの配列から、各レースの開始位置（末尾に全体の行数）を返す。"""
+    race_ids = np.asarray(race_ids)
+    if len(race_ids) == 0:
+        return np.array([0])
+    starts = np.flatnonzero(np.r_[True, race_ids[1:] != race_ids[:-1]])
+    return np.r_[starts, len(race_ids)]
+
+
+def compute_contributions(model, df: pd.DataFrame, features: list[str], chunk_races: int = 500, max_workers: int | None = None) -> np.ndarray:
+    """
+    LightGBM の pred_contrib（TreeSHAP）で各馬・各特徴量の寄与を計算する。
+
+    df は race_id でソート済みであること（preprocess_data の出力はソート済み）。
+    レース境界で chunk_races レースずつに分割し、スレッドで並列に計算する。
+    アンサンブルの場合はメンバーの寄与の平均（= 平均スコアの寄与）を返す。
+
+    Returns:
+        np.ndarray: (行数, 特徴量数 + 1) の float32 配列。最終列はバイアス項で、行の合計が予測スコアになる
+    """
+    ensemble = _as_ensemble(model, features)
+    matrix = ensemble.prepare_matrix(df)
+    offsets = race_offsets(df['race_id'].to_numpy())
+    bounds = list(zip(offsets[:-1:chunk_races], list(offsets[chunk_races:-1:chunk_races]) + [offsets[-1]]))
+
+    def _contrib(bound):
+        start, end = bound
+        total = np.zeros((end - start, matrix.shape[1] + 1))
+        for booster in ensemble.boosters:
+            total += booster.predict(
+                matrix[start:end], pred_contrib=True,
+                num_iteration=booster.best_iteration or None, num_threads=1,
+            )
+        return (total / len(ensemble.boosters)).astype(np.float32)
+
+    if not bounds:
+        return np.zeros((0, matrix.shape[1] + 1), dtype=np.float32)
+    max_workers = max_workers or min(len(bounds), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return np.vstack(list(executor.map(_contrib, bounds)))
+
+
+def _prune_contributions(cache_dir, keep: int) -> None:
+    """寄与キャッシュを、最終利用（.npy の更新時刻）が新しい keep 個だけ残して削除する。"""
+    entries = []
+    for model_dir in os.scandir(cache_dir):
+        if not model_dir.is_dir():
+            continue
+        for entry in os.scandir(model_dir.path):
+            if entry.name.startswith("contrib_") and entry.name.endswith(".npy") and ".tmp" not in entry.name:
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+
+    for _, matrix_path in sorted(entries, reverse=True)[keep:]:
+        # メタ情報 → 行列の順に消す（メタ情報だけが残ると読み込み時に行列がなく壊れるため）
+        for path in (f"{matrix_path[:-len('.npy')]}.json", matrix_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 他のプロセスが先に削除した
+                pass
+        try:
+            os.rmdir(os.path.dirname(matrix_path))
+        except OSError:
+            # まだ他のキャッシュが残っている
+            pass
+
+
+def load_or_compute_contributions(
+    model,
+    df: pd.DataFrame,
+    features: list[str],
+    cache_dir=PREDICTION_CACHE_DIR,
+    keep: int = PREDICTION_CACHE_KEEP,
+) -> dict:
+    """
+    寄与をキャッシュから読み込む（なければ計算して保存する）。
+
+    保存先: cache_dir/<モデルの指紋>/contrib_<データの指紋>.npy（+ 同名の .json にメタ情報）
+    寄与行列はメモリマップで開くため、1レース分の参照はファイル全体を読まずに済む。
+    キャッシュは全モデル合計で最近使った keep 個だけ残す。
+
+    Returns:
+        dict: contrib（(行数, 特徴量数 + 1)）, features, race_ids, horse_numbers, offsets
+    """
+    model_dir = os.path.join(cache_dir, fingerprint_model(model)[:16])
+    data_key = fingerprint_frame(df, ['race_id', 'horse_number'] + features)[:16]
+    matrix_path = os.path.join(model_dir, f"contrib_{data_key}.npy")
+    meta_path = os.path.join(model_dir, f"contrib_{data_key}.json")
+
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        print(f"> 寄与（pred_contrib）を計算中: {len(df)} 頭 / {df['race_id'].nunique()} レース")
+        contrib = compute_contributions(model, df, features)
+        os.makedirs(model_dir, exist_ok=True)
+        # 行列 → メタ情報の順に、プロセスごとの一時ファイルから置き換える（途中で落ちても壊れたファイルを残さない）
+        tmp_matrix_path = f"{matrix_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_matrix_path, contrib)
+        os.replace(tmp_matrix_path, matrix_path)
+        tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "features": features,
+                "race_ids": df['race_id'].astype(str).tolist(),
+                "horse_numbers": df['horse_number'].tolist(),
+            }, f, ensure_ascii=False)
+        os.replace(tmp_meta_path, meta_path)
+        _prune_contributions(cache_dir, keep)
+    else:
+        # 最近使ったキャッシュとして残るよう、更新時刻を進める
+        os.utime(matrix_path)
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    race_ids = np.asarray(meta["race_ids"])
+    return {
+        "contrib": np.load(matrix_path, mmap_mode="r"),
+        "features": meta["features"],
+        "race_ids": race_ids,
+        "horse_numbers": np.asarray(meta["horse_numbers"]),
+        "offsets": race_offsets(race_ids),
+    }
+
+
+def race_breakdown(explanation: dict, race_id) -> pd.DataFrame:
+    """1レース分の各馬の特徴量寄与を返す（行: 馬番、列: 特徴量 + bias + score）。"""
+    race_ids = explanation["race_ids"]
+    start = np.searchsorted(race_ids, str(race_id), side="left")
+    end = np.searchsorted(race_ids, str(race_id), side="right")
+    if start == end:
+        raise KeyError(f"race_id が見つかりません: {race_id}")
+
+    contrib = np.asarray(explanation["contrib"][start:end])
+    breakdown = pd.DataFrame(
+        contrib, columns=explanation["features"] + ["bias"],
+        index=pd.Index(explanation["horse_numbers"][start:end], name="horse_number"),
+    )
+    breakdown["score"] = contrib.sum(axis=1)
+    return breakdown.sort_values("score", ascending=False)
+
+
+def feature_importance_report(explanation: dict) -> pd.DataFrame:
+    """
+    全レースを通した特徴量ごとの寄与の集計を返す。
+
+    mean_abs       : 1頭あたりの |寄与| の平均
+    race_share     : レース内の |寄与| 合計に占める割合のレース平均
+    mean_signed    : 寄与の平均（符号付き）
+    """
+    contrib = np.abs(np.asarray(explanation["contrib"][:, :-1], dtype=np.float64))
+    signed = np.asarray(explanation["contrib"][:, :-1], dtype=np.float64)
+    starts = explanation["offsets"][:-1]
+
+    if len(contrib) == 0:
+        return pd.DataFrame(columns=["feature", "mean_abs", "race_share", "mean_signed"])
+
+    per_race = np.add.reduceat(contrib, starts, axis=0)
+    totals = per_race.sum(axis=1, keepdims=True)
+    share = np.divide(per_race, totals, out=np.zeros_like(per_race), where=totals > 0)
+
+    report = pd.DataFrame({
+        "feature": explanation["features"],
+        "mean_abs": contrib.mean(axis=0),
+        "race_share": share.mean(axis=0),
+        "mean_signed": signed.mean(axis=0),
+    })
+    return report.sort_values("mean_abs", ascending=False).reset_index(drop=True)
+
+
+def main(race_id: str | None = None, use_ensemble: bool = False):
+    print("1. 学習済みモデルを読み込みます...")
+    try:
+        model = load_model(use_ensemble)
+    except FileNotFoundError as e:
+        print(f"エラー: モデルファイルが見つかりません: {e.filename}")
+        return
+
+    print("2. 未知データを読み込み、前処理します...")
+    _, df_new = load_and_split_data(DATA_PATH, TRAIN_RATIO)
+    if df_new.empty:
+        print("対象のデータがありません。")
+        return
+
+    features = [f for f in FEATURE_COLS if f in df_new.columns]
+    print("3. 特徴量の寄与を取得します...")
+    explanation = load_or_compute_contributions(model, df_new.reset_index(drop=True), features)
+
+    print("\n--- 特徴量の寄与（全レース集計）---")
+    print(feature_importance_report(explanation).to_string(index=False))
+
+    race_id = race_id or explanation["race_ids"][0]
+    print(f"\n--- レース {race_id} の寄与内訳 ---")
+    print(race_breakdown(explanation, race_id).to_string(float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--race-id", type=str, default=None, help="寄与内訳を表示するレース（省略時は先頭レース）")
+    parser.add_argument("--ensemble", action="store_true", help="シードアンサンブル（train.py --ensemble-size）で説明する")
+    args = parser.parse_args()
+    main(args.race_id, args.ensemble)
@@ -0,0 +1,206 @@
+import sys
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from analytical_aI.config.index import DATA_PATH, TRAIN_RATIO, CACHE_DIR
+from analytical_aI.data.loader import load_and_split_data, load_and_process_race_data
+from analytical_aI.data.preprocessor import FEATURE_COLS, preprocess_data
+from analytical_aI.data.feature_registry import FEATURE_REGISTRY, apply_features, feature_dependents
+from analytical_aI.models.ensemble import load_model, race_softmax
+
+SNAPSHOT_DIR = CACHE_DIR / 'snapshots'
+
+# 発走直前まで確定しない列（締切前オッズで差し替える）
+POST_TIME_COLS = ["odds", "popularity"]
+
+# スナップショットに残す識別用の列
+ID_COLS = ["race_id", "horse_number", "horse_id", "jockey_id", "jockey", "horse_name"]
+
+
+def post_time_features(scratched: bool = False) -> list[str]:
+    """
+    発走直前に再計算が必要な特徴量を依存順に返す。
+
+    オッズに（推移的に）依存する特徴量に加え、取消・除外で頭数が変わった場合は
+    レース内の行構成に依存する特徴量（出走頭数・レース内偏差など）も対象にする。
+    """
+    for name in feature_dependents(POST_TIME_COLS):
+        if not FEATURE_REGISTRY[name]["race_local"]:
+            raise ValueError(f"'{name}' は過去レースを参照するため、スナップショット上で再計算できません。")
+
+    changed = POST_TIME_COLS + (["race_id"] if scratched else [])
+    return [name for name in feature_dependents(changed) if FEATURE_REGISTRY[name]["race_local"]]
+
+
+def _snapshot_columns(df: pd.DataFrame) -> list[str]:
+    """スナップショットに保存する列（識別子・特徴量・直前再計算に必要な入力列）。"""
+    recompute = post_time_features(scratched=True)
+    input_cols = [c for name in recompute for c in FEATURE_REGISTRY[name]["inputs"]]
+    columns = ID_COLS + FEATURE_COLS + input_cols + POST_TIME_COLS
+    return [c for c in dict.fromkeys(columns) if c in df.columns]
+
+
+def build_race_snapshots(df: pd.DataFrame, snapshot_dir=SNAPSHOT_DIR) -> list[str]:
+    """
+    前処理済み df から、レースごとの前日スナップショットを保存する（1レース1ファイル）。
+
+    オッズに依存する列は発走直前まで分からないものとして NaN にしておく。
+    戻り値は保存した race_id の一覧。
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    odds_dependent = [c for name in post_time_features() for c in FEATURE_REGISTRY[name]["outputs"]]
+
+    snapshot = df[_snapshot_columns(df)].copy()
+    snapshot[[c for c in POST_TIME_COLS + odds_dependent if c in snapshot.columns]] = np.nan
+
+    race_ids = []
+    for race_id, race_df in snapshot.groupby("race_id", sort=True, observed=True):
+        path = os.path.join(snapshot_dir, f"{race_id}.pkl")
+        race_df.reset_index(drop=True).to_pickle(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        race_ids.append(race_id)
+    return race_ids
+
+
+def _card_batches(card_raw: list[dict]) -> list[list[dict]]:
+    """
+    出馬表のレコードを、同じ馬・騎手が2回以上出てこないレースの組に分ける。
+
+    同じ組で前処理すると、先のレースの（結果のない）騎乗が後のレースの騎手勝率などの
+    履歴に入ってしまうため、組ごとに過去のレース結果と合わせて前処理する。
+    """
+    races: dict[str, list[dict]] = {}
+    for record in card_raw:
+        races.setdefault(str(record["race_id"]), []).append(record)
+
+    batches: list[tuple[list[dict], set]] = []
+    for race_id in sorted(races):
+        keys = {("horse", r.get("horse_id")) for r in races[race_id] if r.get("horse_id") is not None}
+        keys |= {
+            ("jockey", r.get("jockey_id", r.get("jockey"))) for r in races[race_id]
+            if r.get("jockey_id", r.get("jockey")) is not None
+        }
+        for records, used in batches:
+            if not keys & used:
+                records.extend(races[race_id])
+                used |= keys
+                break
+        else:
+            batches.append((list(races[race_id]), set(keys)))
+    return [records for records, _ in batches]
+
+
+def build_card_snapshots(results_raw: list[dict], card_raw: list[dict], snapshot_dir=SNAPSHOT_DIR) -> list[str]:
+    """
+    出馬表（未実施レース）から前日スナップショットを作る。
+
+    過去走の特徴量は results_raw（実施済みレースの結果）だけから計算する。
+    出馬表のレースは着順・オッズによる行の除外をせず、オッズ依存の列は build_race_snapshots と同様に NaN にする。
+    戻り値は保存した race_id の一覧。
+    """
+    card_ids = {str(r["race_id"]) for r in card_raw}
+    results_raw = [r for r in results_raw if str(r["race_id"]) not in card_ids]
+
+    race_ids = []
+    for batch in _card_batches(card_raw):
+        batch_ids = {str(r["race_id"]) for r in batch}
+        # 入力が毎回異なるため、特徴量キャッシュは使わない
+        df, _ = preprocess_data(results_raw + batch, use_cache=False, card_race_ids=batch_ids)
+        df = df[df["race_id"].astype(str).isin(batch_ids)].reset_index(drop=True)
+        race_ids += build_race_snapshots(df, snapshot_dir)
+    return sorted(race_ids)
+
+
+def load_race_snapshot(race_id, snapshot_dir=SNAPSHOT_DIR) -> pd.DataFrame:
+    return pd.read_pickle(os.path.join(snapshot_dir, f"{race_id}.pkl"))
+
+
+def apply_post_time_odds(snapshot: pd.DataFrame, odds: dict) -> pd.DataFrame:
+    """
+    スナップショットに締切前オッズ（{馬番: 単勝オッズ}）を差し込み、依存する列だけを再計算する。
+
+    preprocess_data と同様に、オッズがない / 0 以下の馬（取消・除外）は除外する。
+    """
+    df = snapshot.copy()
+    df["odds"] = pd.to_numeric(df["horse_number"].map({int(k): v for k, v in odds.items()}), errors="coerce")
+    df["popularity"] = df["odds"].rank(method="min")
+
+    valid = df["odds"].notna() & (df["odds"] > 0)
+    scratched = not valid.all()
+    df = df[valid].reset_index(drop=True)
+
+    return apply_features(df, post_time_features(scratched))
+
+
+def predict_post_time(snapshot: pd.DataFrame, odds: dict, model) -> pd.DataFrame:
+    """締切前オッズで特徴量を差分更新し、予測スコア・レース内 softmax 勝率・期待値を返す。"""
+    df = apply_post_time_odds(snapshot, odds)
+    features = [f for f in FEATURE_COLS if f in df.columns]
+
+    df["predicted_score"] = model.predict(df[features])
+    df["predicted_win_rate"] = race_softmax(df["predicted_score"].to_numpy(), df["race_id"].to_numpy())
+    df["expected_value"] = df["predicted_win_rate"] * df["odds"]
+    return df
+
+
+def main(
+    command: str,
+    race_id: str | None = None,
+    odds_path: str | None = None,
+    use_ensemble: bool = False,
+    card_path: str | None = None,
+):
+    if command == "build" and card_path is not None:
+        print("1. 出馬表と過去のレース結果を読み込み、前処理します...")
+        card_raw = load_and_process_race_data(card_path)
+        if not card_raw:
+            print("出馬表のデータがありません。")
+            return
+        race_ids = build_card_snapshots(load_and_process_race_data(DATA_PATH), card_raw)
+        print(f"✅ {len(race_ids)} レース分のスナップショットを '{SNAPSHOT_DIR}' に保存しました。")
+        return
+
+    if command == "build":
+        print("1. 未知データを読み込み、前処理します...")
+        _, df_new = load_and_split_data(DATA_PATH, TRAIN_RATIO)
+        if df_new.empty:
+            print("対象のデータがありません。")
+            return
+        race_ids = build_race_snapshots(df_new)
+        print(f"✅ {len(race_ids)} レース分のスナップショットを '{SNAPSHOT_DIR}' に保存しました。")
+        return
+
+    try:
+        model = load_model(use_ensemble)
+        snapshot = load_race_snapshot(race_id)
+    except FileNotFoundError as e:
+        print(f"エラー: ファイルが見つかりません: {e.filename}")
+        return
+
+    with open(odds_path, "r", encoding="utf-8") as f:
+        odds = json.load(f)
+
+    result = predict_post_time(snapshot, odds, model)
+    display_cols = [c for c in ["horse_number", "horse_name", "odds", "predicted_win_rate", "expected_value"] if c in result.columns]
+    print(f"\n--- レース {race_id} の予測（締切前オッズ）---")
+    print(result[display_cols].sort_values("expected_value", ascending=False).to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "predict"], help="build: 前日スナップショット作成 / predict: 締切前オッズで予測")
+    parser.add_argument("--race-id", type=str, default=None, help="predict 対象のレース")
+    parser.add_argument("--odds", type=str, default=None, help='締切前オッズの JSON ファイル（{"馬番": オッズ, ...}）')
+    parser.add_argument("--ensemble", action="store_true", help="シードアンサンブル（train.py --ensemble-size）で予測する")
+    parser.add_argument("--card-path", type=str, default=None, help="build 対象の出馬表ディレクトリ（レースデータと同じ JSON 形式。省略時は未知データの実施済みレース）")
+    args = parser.parse_args()
+    if args.command == "predict" and not (args.race_id and args.odds):
+        parser.error("predict には --race-id と --odds が必要です。")
+    main(args.command, args.race_id, args.odds, args.ensemble, args.card_path)
@@ -1,5 +1,6 @@
 import sys
 import os
+import argparse
 import pandas as pd
 import lightgbm as lgb
 from lightgbm.callback import early_stopping, log_evaluation
@@ -12,10 +13,18 @@ if project_root not in sys.path:
 from analytical_aI.config.index import DATA_PATH, MODELS_DIR, TRAIN_RATIO
 from analytical_aI.data.loader import load_and_split_data
 from analytical_aI.data.preprocessor import FEATURE_COLS, CAT_COLS
+from analytical_aI.data.fingerprint import fingerprint_frame, fingerprint_params
+from analytical_aI.models.ensemble import SINGLE_MODEL_PATH, train_seed_ensemble, save_ensemble
+from analytical_aI.models.checkpoint import CHECKPOINT_DIR, checkpointed_early_stopping, load_checkpoint, restore_best_iteration
 
 
 
-def main():
+def main(
+    ensemble_size: int = 0,
+    base_seed: int = 42,
+    checkpoint_every: int = 0,
+    time_budget: float | None = None,
+):
     # --- Step 1: データの読み込み・前処理・train/unseen分割 ---
     print("1. データの読み込みと前処理を開始します...")
     df, _ = load_and_split_data(DATA_PATH, TRAIN_RATIO)
@@ -52,6 +61,13 @@ def main():
     print(f"> 使用特徴量: {available_features}")
 
     # --- Step 3: LambdaRank モデルの学習 ---
+    if ensemble_size > 0:
+        seeds = [base_seed + i for i in range(ensemble_size)]
+        print(f"\n3. シード違いの LambdaRank モデルを {ensemble_size} 個学習します（seeds={seeds}）...")
+        ensemble = train_seed_ensemble(X_train, y_train, group_train, X_val, y_val, group_val, seeds)
+        save_ensemble(ensemble)
+        return
+
     print("\n3. LambdaRank モデルを学習します...")
 
     model = lgb.LGBMRanker(
@@ -62,22 +78,64 @@ def main():
         learning_rate=0.05,
         num_leaves=63,
         importance_type="gain",
-        random_state=42,
+        random_state=base_seed,
     )
 
-    model.fit(
-        X_train,
-        y_train,
-        group=group_train,
-        eval_set=[(X_val, y_val)],
-        eval_group=[group_val],
-        eval_at=[3, 5],
-        categorical_feature=CAT_COLS,
-        callbacks=[
-            early_stopping(stopping_rounds=50),
-            log_evaluation(period=50),
-        ],
-    )
+    if checkpoint_every <= 0 and time_budget is None:
+        model.fit(
+            X_train,
+            y_train,
+            group=group_train,
+            eval_set=[(X_val, y_val)],
+            eval_group=[group_val],
+            eval_at=[3, 5],
+            categorical_feature=CAT_COLS,
+            callbacks=[
+                early_stopping(stopping_rounds=50),
+                log_evaluation(period=50),
+            ],
+        )
+    else:
+        # --- チェックポイント付き学習（中断しても最後のチェックポイントから再開できる）---
+        # 学習データ・検証データ・パラメータが同じときだけ同じチェックポイントを使う
+        checkpoint_dir = CHECKPOINT_DIR / "-".join(fp[:12] for fp in [
+            fingerprint_frame(train_df, available_features + ['race_id', 'label']),
+            fingerprint_frame(val_df, available_features + ['race_id', 'label']),
+            fingerprint_params(model.get_params()),
+        ])
+        init_model, state = load_checkpoint(checkpoint_dir)
+
+        if state is not None and state.get("stopped") in ("early_stopping", "completed"):
+            # 前回は最後のチェックポイントの書き込み後、モデルの保存前に終了した可能性があるため、
+            # 最良イテレーションまでのブースターから LGBMRanker を復元して保存し直す
+            print(f"> チェックポイント '{checkpoint_dir}' は学習完了済みです（{state['stopped']}）。")
+            init_model = lgb.Booster(model_str=init_model.model_to_string(num_iteration=state["stopped_best_iteration"] + 1))
+            model.set_params(n_estimators=1)
+            stopping = restore_best_iteration(state)
+        else:
+            done_rounds = 0 if state is None else state["iteration"] + 1
+            if state is not None:
+                print(f"> チェックポイントから再開します（{done_rounds} イテレーション完了済み）: {checkpoint_dir}")
+            model.set_params(n_estimators=model.get_params()["n_estimators"] - done_rounds)
+            stopping = checkpointed_early_stopping(
+                checkpoint_dir,
+                stopping_rounds=50,
+                checkpoint_every=checkpoint_every,
+                time_budget=time_budget * 60 if time_budget is not None else None,
+                state=state,
+            )
+
+        model.fit(
+            X_train,
+            y_train,
+            group=group_train,
+            eval_set=[(X_val, y_val)],
+            eval_group=[group_val],
+            eval_at=[3, 5],
+            categorical_feature=CAT_COLS,
+            init_model=init_model,
+            callbacks=[stopping, log_evaluation(period=50)],
+        )
 
     # --- Step 4: 予測スコアの確認（検証データのサンプル表示）---
     print("\n4. 検証データで予測スコアを確認します...")
@@ -98,11 +156,16 @@ def main():
 
     # --- Step 5: モデルの保存 ---
     os.makedirs(MODELS_DIR, exist_ok=True)
-    model_path = MODELS_DIR / 'lambdarank_model.joblib'
-    dump(model, model_path)
-    print(f"\n✅ 学習済みモデルを '{model_path}' として保存しました。")
+    dump(model, SINGLE_MODEL_PATH)
+    print(f"\n✅ 学習済みモデルを '{SINGLE_MODEL_PATH}' として保存しました。")
     print(f"   最良イテレーション: {model.best_iteration_}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ensemble-size", type=int, default=0, help="シードアンサンブルのモデル数（0 なら単体モデル）")
+    parser.add_argument("--base-seed", type=int, default=42, help="ベースシード（デフォルト: 42）")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="N イテレーションごとにチェックポイントを保存して再開可能にする（0 で無効）")
+    parser.add_argument("--time-budget", type=float, default=None, help="学習時間の上限（分）。超えたら最良イテレーションで保存して終了する")
+    args = parser.parse_args()
+    main(args.ensemble_size, args.base_seed, args.checkpoint_every, args.time_budget)